@@ -308,7 +308,7 @@ class FileCompressorApp:
                 if found_path != ffmpeg_path and found_path != self.config_manager.settings.get('ffmpeg_path'):
                     self.config_manager.set('ffmpeg_path', found_path)
                     # 更新video_compressor的ffmpeg路径
-                    self.video_compressor.ffmpeg_path = found_path
+                    self.video_compressor.reload_config()
                     self.logger.info(f"已自动更新FFmpeg路径: {found_path}")
         except Exception as e:
             self.logger.error(f"检查FFmpeg时出错: {e}")
@@ -413,7 +413,7 @@ class FileCompressorApp:
             self.config_manager.save()
             
             # 更新video_compressor
-            self.video_compressor.ffmpeg_path = ffmpeg_path
+            self.video_compressor.reload_config()
             
             window.destroy()
         else:
@@ -1294,9 +1294,8 @@ class FileCompressorApp:
             self.config_manager.set('auto_exclude_non_media', self.auto_exclude_non_media)
             self.config_manager.save()
             
-            # 刷新图像和视频压缩器的配置
-            self.image_compressor = ImageCompressor(self.config_manager, self.logger)
-            self.video_compressor = VideoCompressor(self.config_manager, self.logger)
+            # 刷新视频压缩器的配置（图片压缩器每次压缩时读取配置，无需处理）
+            self.video_compressor.reload_config()
             
             messagebox.showinfo("成功", "设置已保存\n\n注意：如需更新文件列表，请手动点击\"刷新列表\"按钮")
             
@@ -1449,7 +1448,7 @@ class FileCompressorApp:
         try:
             total_files = len(files_to_process)
             processed_files = 0
-            max_workers = max(1, os.cpu_count() // 2)
+            max_workers = self.config_manager.get('max_parallel_jobs', 0) or max(1, os.cpu_count() // 2)
             
             # 创建目标文件夹结构
             for file_index, file_info in files_to_process:
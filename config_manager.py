@@ -60,6 +60,14 @@ class ConfigManager:
             'nvidia_preset': 'p4',
             'nvidia_video_bitrate': '5000k',
             'nvidia_rc': 'cbr',
+            'nvidia_throughput_mode': False,  # 批量编码时加深NVENC队列以提高吞吐量
+            # 质量优先级：speed（速度优先）, balanced（平衡）, size（体积优先）
+            'quality_priority': 'balanced',
+            'preserve_bitdepth': True,  # 10位源视频保留10位输出（CPU的HEVC/AV1编码器和AMF；NVENC始终保持源格式）
+            'mp4_fragmented': False,  # 输出分片MP4，省去faststart的二次写入
+            'allowed_root': '',  # 图片和视频压缩允许访问的根目录，为空时不限制
+            'smart_copy': False,  # 源视频已符合目标编码设置时直接复制流
+            'max_parallel_jobs': 0,  # 同时压缩的文件数，0表示自动（CPU核心数的一半）
             'auto_exclude_non_media': True
         }
         
@@ -178,6 +186,20 @@ class ConfigManager:
                                                                 fallback=self.defaults['nvidia_video_bitrate'])
         self.settings['nvidia_rc'] = self.config.get('General', 'nvidia_rc', 
                                                     fallback=self.defaults['nvidia_rc'])
+        self.settings['nvidia_throughput_mode'] = self.config.getboolean('General', 'nvidia_throughput_mode', 
+                                                                         fallback=self.defaults['nvidia_throughput_mode'])
+        self.settings['quality_priority'] = self.config.get('General', 'quality_priority', 
+                                                           fallback=self.defaults['quality_priority'])
+        self.settings['preserve_bitdepth'] = self.config.getboolean('General', 'preserve_bitdepth', 
+                                                                    fallback=self.defaults['preserve_bitdepth'])
+        self.settings['mp4_fragmented'] = self.config.getboolean('General', 'mp4_fragmented', 
+                                                                 fallback=self.defaults['mp4_fragmented'])
+        self.settings['allowed_root'] = self.config.get('General', 'allowed_root', 
+                                                        fallback=self.defaults['allowed_root'])
+        self.settings['smart_copy'] = self.config.getboolean('General', 'smart_copy', 
+                                                             fallback=self.defaults['smart_copy'])
+        self.settings['max_parallel_jobs'] = self.config.getint('General', 'max_parallel_jobs', 
+                                                                fallback=self.defaults['max_parallel_jobs'])
         
         # 路径配置
         self.settings['source_dir'] = ''
@@ -223,6 +245,13 @@ class ConfigManager:
         self.config.set('General', 'nvidia_preset', self.settings.get('nvidia_preset', self.defaults['nvidia_preset']))
         self.config.set('General', 'nvidia_video_bitrate', self.settings.get('nvidia_video_bitrate', self.defaults['nvidia_video_bitrate']))
         self.config.set('General', 'nvidia_rc', self.settings.get('nvidia_rc', self.defaults['nvidia_rc']))
+        self.config.set('General', 'nvidia_throughput_mode', str(self.settings.get('nvidia_throughput_mode', self.defaults['nvidia_throughput_mode'])))
+        self.config.set('General', 'quality_priority', self.settings.get('quality_priority', self.defaults['quality_priority']))
+        self.config.set('General', 'preserve_bitdepth', str(self.settings.get('preserve_bitdepth', self.defaults['preserve_bitdepth'])))
+        self.config.set('General', 'mp4_fragmented', str(self.settings.get('mp4_fragmented', self.defaults['mp4_fragmented'])))
+        self.config.set('General', 'allowed_root', self.settings.get('allowed_root', self.defaults['allowed_root']))
+        self.config.set('General', 'smart_copy', str(self.settings.get('smart_copy', self.defaults['smart_copy'])))
+        self.config.set('General', 'max_parallel_jobs', str(self.settings.get('max_parallel_jobs', self.defaults['max_parallel_jobs'])))
         
         # 保存路径
         if not self.config.has_section('Paths'):
@@ -343,6 +372,19 @@ class ConfigManager:
             errors.append(f"Nvidia码率控制模式 ({nvidia_rc}) 无效")
             self.settings['nvidia_rc'] = self.defaults['nvidia_rc']
         
+        # 验证质量优先级
+        quality_priority = self.settings.get('quality_priority', self.defaults['quality_priority'])
+        valid_priorities = ['speed', 'balanced', 'size']
+        if quality_priority not in valid_priorities:
+            errors.append(f"质量优先级 ({quality_priority}) 无效")
+            self.settings['quality_priority'] = self.defaults['quality_priority']
+        
+        # 验证并行任务数
+        max_parallel_jobs = self.settings.get('max_parallel_jobs', self.defaults['max_parallel_jobs'])
+        if max_parallel_jobs < 0:
+            errors.append(f"并行任务数 ({max_parallel_jobs}) 不能为负数")
+            self.settings['max_parallel_jobs'] = self.defaults['max_parallel_jobs']
+        
         # 验证FFmpeg路径
         ffmpeg_path = self.settings.get('ffmpeg_path', self.defaults['ffmpeg_path'])
         if not os.path.isfile(ffmpeg_path):
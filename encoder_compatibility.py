@@ -278,7 +278,8 @@ class EncoderCompatibility:
         
         return compatible_encoders
     
-    def get_compatible_audio_codecs(self, container_ext, video_encoder=None):
+    @classmethod
+    def get_compatible_audio_codecs(cls, container_ext, video_encoder=None):
         """
         获取与容器格式兼容的音频编码器列表
         
@@ -290,15 +291,16 @@ class EncoderCompatibility:
             兼容的音频编码器列表
         """
         container_ext = container_ext.lower()
-        if container_ext not in self.CONTAINERS:
+        if container_ext not in cls.CONTAINERS:
             return []
         
-        container_info = self.CONTAINERS[container_ext]
+        container_info = cls.CONTAINERS[container_ext]
         
-        if video_encoder and video_encoder in self.ENCODERS:
-            encoder_info = self.ENCODERS[video_encoder]
-            # 取容器和编码器都支持的音频编码器
-            compatible = list(set(container_info['audio_codecs']) & set(encoder_info['audio_codecs']))
+        if video_encoder and video_encoder in cls.ENCODERS:
+            encoder_info = cls.ENCODERS[video_encoder]
+            # 取容器和编码器都支持的音频编码器（保持容器列表的优先顺序）
+            compatible = [codec for codec in container_info['audio_codecs']
+                          if codec in encoder_info['audio_codecs']]
             return compatible
         
         return container_info['audio_codecs']
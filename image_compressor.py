@@ -6,6 +6,7 @@ import os
 import shutil
 import logging
 from PIL import Image
+from path_utils import normalize_path
 
 
 class ImageCompressor:
@@ -67,43 +68,33 @@ class ImageCompressor:
                 
         except (FileNotFoundError, PermissionError, OSError) as e:
             self.logger.error(f"压缩图片出错: {source_path}, 错误类型: {type(e).__name__}, 错误: {str(e)}")
-            # 如果压缩失败，直接复制原文件
-            try:
-                shutil.copy2(source_path, target_path)
-                return False  # 返回False表示压缩失败但已复制
-            except Exception as copy_error:
-                self.logger.error(f"复制原始文件失败: {source_path}, 错误: {str(copy_error)}")
-                raise
+            return self._copy_original(source_path, target_path)
         except (ValueError, Image.UnidentifiedImageError, Image.DecompressionBombError) as e:
             self.logger.error(f"图片格式错误或损坏: {source_path}, 错误类型: {type(e).__name__}, 错误: {str(e)}")
-            # 如果压缩失败，直接复制原文件
-            try:
-                shutil.copy2(source_path, target_path)
-                return False
-            except Exception as copy_error:
-                self.logger.error(f"复制原始文件失败: {source_path}, 错误: {str(copy_error)}")
-                raise
+            return self._copy_original(source_path, target_path)
         except Exception as e:
             self.logger.error(f"压缩图片时发生未知错误: {source_path}, 错误类型: {type(e).__name__}, 错误: {str(e)}")
-            try:
-                shutil.copy2(source_path, target_path)
-                return False
-            except Exception as copy_error:
-                self.logger.error(f"复制原始文件失败: {source_path}, 错误: {str(copy_error)}")
-                raise
+            return self._copy_original(source_path, target_path)
     
-    @staticmethod
-    def _normalize_path(path):
-        """规范化路径"""
-        if not path:
-            return None
+    def _copy_original(self, source_path, target_path):
+        """
+        压缩失败时直接复制原文件
+        
+        shutil.copy2内部使用shutil.copyfile，在Linux上通过os.sendfile、在Windows上通过CopyFileExW
+        在内核中完成复制，数据不经过Python缓冲区。
+        
+        Returns:
+            False（表示压缩失败但已复制）
+        """
         try:
-            from pathlib import Path
-            normalized = Path(path).resolve()
-            path_str = str(normalized)
-            if '..' in path_str or path_str.startswith('\\\\'):
-                return None
-            return str(normalized)
-        except (ValueError, OSError):
-            return None
+            shutil.copy2(source_path, target_path)
+            self.logger.info(f"已复制原始文件代替压缩结果: {source_path} -> {target_path}")
+            return False
+        except Exception as copy_error:
+            self.logger.error(f"复制原始文件失败: {source_path}, 错误: {str(copy_error)}")
+            raise
+    
+    def _normalize_path(self, path):
+        """规范化路径，并校验是否在配置的allowed_root目录内"""
+        return normalize_path(path, self.config.get('allowed_root', '') or None)
 
@@ -4,6 +4,8 @@
 """
 import os
 import sys
+import functools
+from pathlib import PureWindowsPath
 
 
 # 获取当前文件所在目录（v2目录）
@@ -113,3 +115,57 @@ def get_history_dir():
         # 开发模式，使用v2目录下的history
         return os.path.join(V2_DIR, 'history')
 
+
+@functools.lru_cache(maxsize=4096)
+def _normalize_path_cached(path, allowed_root=None):
+    """
+    规范化路径（带缓存）
+    
+    不限制根目录时使用os.path.abspath代替Path.resolve()：只做字符串层面的规范化，
+    不逐级stat父目录，在网络路径上开销小得多；限制根目录时用realpath解析符号链接。
+    
+    Args:
+        path: 待规范化的路径
+        allowed_root: 允许访问的根目录，为空时不限制
+        
+    Returns:
+        规范化后的绝对路径，路径无效或超出允许范围时返回None
+    """
+    try:
+        # abspath已消除所有'..'，此后只需检查结果是否仍在允许的根目录内
+        path_str = os.path.abspath(path)
+        if sys.platform == 'win32':
+            win_path = PureWindowsPath(path_str)
+            # 只接受带盘符的本地绝对路径，拒绝UNC网络路径（\\server\share）
+            if not win_path.is_absolute() or win_path.drive.startswith('\\\\'):
+                return None
+        if allowed_root:
+            # 解析符号链接后再比较，根目录内指向外部的链接同样视为越界；
+            # Windows路径不区分大小写，两边都用normcase比较
+            path_str = os.path.realpath(path_str)
+            root = os.path.normcase(os.path.realpath(allowed_root))
+            # 不同盘符时commonpath抛出ValueError，同样视为越界
+            if os.path.normcase(os.path.commonpath([path_str, root])) != root:
+                return None
+        return path_str
+    except (ValueError, OSError):
+        return None
+
+
+def normalize_path(path, allowed_root=None):
+    """
+    规范化路径，并校验是否在allowed_root目录内（图片和视频压缩器共用）
+    
+    Args:
+        path: 待规范化的路径
+        allowed_root: 允许访问的根目录，为空时不限制
+        
+    Returns:
+        规范化后的绝对路径，路径为空、无效或超出允许范围时返回None
+    """
+    if not path:
+        return None
+    # 相对路径依赖当前工作目录，不缓存；限制根目录时结果依赖符号链接的当前指向，同样不缓存
+    if allowed_root or not os.path.isabs(path):
+        return _normalize_path_cached.__wrapped__(path, allowed_root)
+    return _normalize_path_cached(path, allowed_root)
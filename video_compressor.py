@@ -9,13 +9,111 @@ import sys
 import shutil
 import subprocess
 import re
+import json
 import logging
+import functools
 from encoder_compatibility import EncoderCompatibility
+from path_utils import normalize_path
+
+
+# 音频编码器对应的输出比特率（未列出的编码器使用FFmpeg默认值）
+_AUDIO_BITRATE = {
+    'aac': '128k',
+    'opus': '128k',
+    'mp3': '192k'
+}
+
+
+@functools.lru_cache(maxsize=256)
+def _audio_for(container_ext, encoder, preferred):
+    """
+    选择与容器格式和视频编码器兼容的音频编码器（带缓存）
+    
+    Args:
+        container_ext: 容器格式扩展名
+        encoder: 视频编码器名称
+        preferred: 配置中首选的音频编码器
+        
+    Returns:
+        音频编码器名称，首选编码器不兼容时返回第一个兼容的编码器
+    """
+    compatible_audio = EncoderCompatibility.get_compatible_audio_codecs(container_ext, encoder)
+    if preferred in compatible_audio:
+        return preferred
+    return compatible_audio[0] if compatible_audio else 'aac'
 
 
 class VideoCompressor:
     """视频压缩器"""
     
+    # Windows下隐藏FFmpeg控制台窗口（类加载时计算一次）
+    CREATIONFLAGS = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+    
+    # GPU模式下可替换为显存内实现的滤镜，帧数据不离开显存
+    HW_FILTERS = {
+        'nvidia': {'scale': 'scale_cuda'},
+        'amd': {'scale': 'scale_amf'}
+    }
+    
+    # 10位及以上源视频保留位深时使用的像素格式（其余编码器统一使用yuv420p）
+    # NVENC不经过_select_pix_fmt：解码帧留在CUDA显存中并保持源格式，不能再用-pix_fmt转换
+    HIGH_BITDEPTH_PIX_FMTS = {
+        'libx265': 'yuv420p10le',
+        'libsvtav1': 'yuv420p10le',
+        'libaom-av1': 'yuv420p10le',
+        'hevc_amf': 'p010le'
+    }
+    
+    # CPU模式下质量优先级对应的编码器和预设（balanced使用配置中的编码器和预设）
+    CPU_PRIORITY_PROFILES = {
+        'speed': ('libx264', 'ultrafast'),
+        'size': ('libsvtav1', '8')
+    }
+    
+    # 体积优先时SVT-AV1使用的CRF值
+    SVTAV1_SIZE_CRF = 30
+    
+    # 4K（3840x2160）的单帧像素数，达到该值视为大分辨率源（不考虑帧率，24/25fps的4K源同样适用）
+    UHD_PIXELS = 3840 * 2160
+    
+    # 支持-split_encode_mode（多NVENC分片编码）的编码器，H.264 NVENC不支持该选项
+    NVENC_SPLIT_ENCODERS = ('hevc_nvenc', 'av1_nvenc')
+    
+    # GPU模式对应的探测编码器和硬件解码加速方式（与命令构建中的-hwaccel一致）
+    GPU_BACKENDS = {
+        'nvidia': {'encoder': 'h264_nvenc', 'hwaccel': 'cuda'},
+        'amd': {'encoder': 'h264_amf', 'hwaccel': 'd3d11va'}
+    }
+    
+    # 容器格式对应的FFmpeg复用器名称（用于识别ffprobe的format_name）
+    CONTAINER_MUXERS = {
+        '.mp4': 'mp4',
+        '.mkv': 'matroska',
+        '.mov': 'mov',
+        '.webm': 'webm',
+        '.avi': 'avi'
+    }
+    
+    # 编码器输出的视频编码格式（与ffprobe的codec_name一致）
+    ENCODER_CODECS = {
+        'libx264': 'h264',
+        'h264_nvenc': 'h264',
+        'h264_amf': 'h264',
+        'libx265': 'hevc',
+        'hevc_nvenc': 'hevc',
+        'hevc_amf': 'hevc',
+        'libvpx': 'vp8',
+        'libvpx-vp9': 'vp9',
+        'libaom-av1': 'av1',
+        'libsvtav1': 'av1'
+    }
+    
+    # 源视频比特率不超过目标比特率的该倍数时视为已满足目标
+    STREAM_COPY_BITRATE_TOLERANCE = 1.1
+    
+    # GPU可用性缓存（(ffmpeg_path, use_gpu) -> bool），硬件在进程运行期间不会变化，所有实例共享
+    _gpu_support_cache = {}
+    
     def __init__(self, config_manager, logger=None):
         """
         初始化视频压缩器
@@ -28,58 +126,50 @@ class VideoCompressor:
         self.logger = logger or logging.getLogger('FileCompressor.VideoCompressor')
         self.ffmpeg_path = config_manager.get('ffmpeg_path')
         self.encoder_compat = EncoderCompatibility(self.ffmpeg_path, logger)
+        self._known_dirs = set()  # 已确认存在的输出目录
+        self._probe_cache = {}  # 缓存ffprobe结果
+    
+    def reload_config(self):
+        """
+        配置修改后重新读取配置（代替重新创建压缩器，保留已缓存的编码器列表和ffprobe结果）
+        
+        编码参数在每次压缩时从配置读取，这里只需处理FFmpeg路径的变化。
+        """
+        ffmpeg_path = self.config.get('ffmpeg_path')
+        if ffmpeg_path != self.ffmpeg_path:
+            self.ffmpeg_path = ffmpeg_path
+            self.encoder_compat = EncoderCompatibility(ffmpeg_path, self.logger)
+            self._probe_cache.clear()
     
-    def compress(self, source_path, target_path):
+    def compress(self, source_path, target_path, vf_chain=None):
         """
         压缩视频文件
         
         Args:
             source_path: 源文件路径
             target_path: 目标文件路径
+            vf_chain: 视频滤镜列表（如['scale=1280:-2']），在同一次FFmpeg调用中完成，不生成中间文件
             
         Returns:
             True如果成功，False如果失败
         """
         try:
-            file_ext = os.path.splitext(target_path)[1].lower()
-            
-            # 获取容器格式（如果没有指定，使用目标文件扩展名）
-            container = self.config.get('video_container', file_ext)
-            if not container.startswith('.'):
-                container = '.' + container
-            
-            # 如果容器格式与目标文件扩展名不匹配，使用目标文件扩展名
-            if container != file_ext:
-                container = file_ext
-            
-            use_gpu = self.config.get('use_gpu', 'cpu')
-            
-            # 检查容器格式是否只支持CPU编码（如WebM）
-            container_info = self.encoder_compat.CONTAINERS.get(container, {})
-            if container_info.get('cpu_only', False):
-                use_gpu = 'cpu'
-                self.logger.info(f"容器格式 {container} 只支持CPU编码，强制使用CPU")
-            
-            # 获取编码器（根据容器和GPU自动选择）
-            encoder = self._get_encoder_for_container(container, use_gpu)
+            container, use_gpu, encoder = self._resolve_encoding(target_path)
             if not encoder:
-                self.logger.error(f"无法为容器格式 {container} 找到合适的编码器")
                 return False
             
-            # 验证编码器与容器的兼容性
-            is_compatible, error_msg = self.encoder_compat.validate_encoder_for_container(
-                encoder, container, use_gpu
-            )
-            if not is_compatible:
-                self.logger.error(f"编码器与容器格式不兼容: {error_msg}")
-                return False
+            # 源文件已符合目标编码设置时直接复制流，无需解码和编码
+            if not vf_chain and self.config.get('smart_copy', False):
+                if self._can_stream_copy(source_path, container, use_gpu, encoder):
+                    if self._stream_copy(source_path, target_path):
+                        return True
             
             if use_gpu == 'nvidia':
-                return self._compress_with_nvidia(source_path, target_path, container, encoder)
+                return self._compress_with_nvidia(source_path, target_path, container, encoder, vf_chain)
             elif use_gpu == 'amd':
-                return self._compress_with_amd(source_path, target_path, container, encoder)
+                return self._compress_with_amd(source_path, target_path, container, encoder, vf_chain)
             else:
-                return self._compress_with_cpu(source_path, target_path, container, encoder)
+                return self._compress_with_cpu(source_path, target_path, container, encoder, vf_chain)
                 
         except Exception as e:
             self.logger.error(f"压缩视频时发生错误: {source_path}, 错误: {str(e)}")
@@ -93,6 +183,124 @@ class VideoCompressor:
                 self.logger.error(f"复制原始视频文件失败: {source_path}, 错误: {str(copy_error)}")
                 raise
     
+    def _can_stream_copy(self, source_path, container_ext, use_gpu, encoder):
+        """
+        检查源文件是否已符合目标设置（编码格式、容器格式相同且比特率不高于目标）
+        
+        Args:
+            source_path: 源文件路径
+            container_ext: 目标容器格式扩展名
+            use_gpu: GPU模式
+            encoder: 目标视频编码器
+            
+        Returns:
+            True如果可以直接复制流
+        """
+        normalized_source = self._normalize_path(source_path)
+        if not normalized_source:
+            return False
+        if os.path.splitext(normalized_source)[1].lower() != container_ext:
+            return False
+        
+        info = self._probe_video(normalized_source)
+        if not info or info.get('codec_name') != self.ENCODER_CODECS.get(encoder):
+            return False
+        if self.CONTAINER_MUXERS.get(container_ext) not in info.get('format_name', '').split(','):
+            return False
+        
+        if use_gpu == 'nvidia':
+            target_bitrate = self.config.get('nvidia_video_bitrate', '5000k')
+        elif use_gpu == 'amd':
+            target_bitrate = self.config.get('amd_video_bitrate', '5000k')
+        else:
+            target_bitrate = self.config.get('video_bitrate', '5000k')
+        target_bps = self._parse_bitrate(target_bitrate)
+        source_bps = info.get('bit_rate', 0)
+        return 0 < source_bps <= target_bps * self.STREAM_COPY_BITRATE_TOLERANCE
+    
+    @staticmethod
+    def _parse_bitrate(bitrate):
+        """把'5000k'形式的比特率转换为bps，无法解析时返回0"""
+        match = re.match(r'^(\d+(?:\.\d+)?)([kmgKMG]?)$', str(bitrate).strip())
+        if not match:
+            return 0
+        multiplier = {'': 1, 'k': 1000, 'm': 1000 ** 2, 'g': 1000 ** 3}[match.group(2).lower()]
+        return int(float(match.group(1)) * multiplier)
+    
+    def _stream_copy(self, source_path, target_path):
+        """直接复制音视频流到目标文件，失败时返回False（由调用方继续正常编码）"""
+        # 与编码命令相同，源文件和目标目录都必须在allowed_root内
+        normalized_source = self._normalize_path(source_path)
+        normalized_target = self._normalize_path(os.path.dirname(target_path))
+        if not normalized_source or not normalized_target:
+            self.logger.warning(f"路径无效或超出允许范围，不直接复制流: {source_path} -> {target_path}")
+            return False
+        
+        cmd = [
+            self.ffmpeg_path,
+            '-i', normalized_source,
+            '-c', 'copy',
+            '-y',
+            target_path
+        ]
+        self.logger.info(f"源视频已符合目标设置，直接复制流: {source_path}")
+        ok, stderr = self._run_ffmpeg(cmd)
+        if ok:
+            self.logger.info(f"视频流复制成功: {source_path} -> {target_path}")
+            return True
+        self.logger.warning(f"视频流复制失败，改为重新编码: {source_path}, 错误: {stderr}")
+        return False
+    
+    def _resolve_encoding(self, target_path):
+        """
+        根据目标文件和配置确定容器格式、GPU模式和编码器
+        
+        Args:
+            target_path: 目标文件路径
+            
+        Returns:
+            (容器格式, GPU模式, 编码器)，没有可用编码器时编码器为None
+        """
+        file_ext = os.path.splitext(target_path)[1].lower()
+        
+        # 获取容器格式（如果没有指定，使用目标文件扩展名）
+        container = self.config.get('video_container', file_ext)
+        if not container.startswith('.'):
+            container = '.' + container
+        
+        # 如果容器格式与目标文件扩展名不匹配，使用目标文件扩展名
+        if container != file_ext:
+            container = file_ext
+        
+        use_gpu = self.config.get('use_gpu', 'cpu')
+        
+        # 检查容器格式是否只支持CPU编码（如WebM）
+        container_info = self.encoder_compat.CONTAINERS.get(container, {})
+        if container_info.get('cpu_only', False):
+            use_gpu = 'cpu'
+            self.logger.info(f"容器格式 {container} 只支持CPU编码，强制使用CPU")
+        
+        # 请求的GPU不可用时直接使用CPU，避免每个文件都先启动一次注定失败的GPU编码
+        if use_gpu in self.GPU_BACKENDS and not self._is_gpu_available(use_gpu):
+            self.logger.info(f"未检测到可用的 {use_gpu} GPU编码，直接使用CPU编码")
+            use_gpu = 'cpu'
+        
+        # 获取编码器（根据容器和GPU自动选择）
+        encoder = self._get_encoder_for_container(container, use_gpu)
+        if not encoder:
+            self.logger.error(f"无法为容器格式 {container} 找到合适的编码器")
+            return container, use_gpu, None
+        
+        # 验证编码器与容器的兼容性
+        is_compatible, error_msg = self.encoder_compat.validate_encoder_for_container(
+            encoder, container, use_gpu
+        )
+        if not is_compatible:
+            self.logger.error(f"编码器与容器格式不兼容: {error_msg}")
+            return container, use_gpu, None
+        
+        return container, use_gpu, encoder
+    
     def _get_encoder_for_container(self, container_ext, use_gpu):
         """
         根据容器格式和GPU模式获取编码器
@@ -104,7 +312,17 @@ class VideoCompressor:
         Returns:
             编码器名称
         """
-        # 首先尝试使用配置的编码器
+        # CPU模式下速度/体积优先时优先使用对应的编码器
+        if use_gpu == 'cpu':
+            profile = self.CPU_PRIORITY_PROFILES.get(self.config.get('quality_priority', 'balanced'))
+            if profile:
+                is_compatible, _ = self.encoder_compat.validate_encoder_for_container(
+                    profile[0], container_ext, use_gpu
+                )
+                if is_compatible:
+                    return profile[0]
+        
+        # 其次尝试使用配置的编码器
         if use_gpu == 'cpu':
             encoder = self.config.get('cpu_encoder', 'libx264')
         elif use_gpu == 'nvidia':
@@ -133,106 +351,354 @@ class VideoCompressor:
         
         return None
     
-    def _compress_with_cpu(self, source_path, target_path, container_ext, encoder):
-        """使用CPU编码压缩视频"""
-        cmd = self._build_cpu_command(source_path, target_path, container_ext, encoder)
+    def _is_gpu_available(self, use_gpu):
+        """
+        检查GPU编码是否可用（每个FFmpeg路径只探测一次）
         
-        self.logger.info(f"使用CPU压缩视频: {source_path}")
-        result = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True,
-            shell=False,
-            creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
-        )
-        self.logger.info(f"CPU视频压缩成功: {source_path} -> {target_path}")
-        return True
+        Args:
+            use_gpu: GPU模式（'nvidia', 'amd'）
+            
+        Returns:
+            True如果可用，False如果不可用
+        """
+        cache_key = (self.ffmpeg_path, use_gpu)
+        if cache_key not in self._gpu_support_cache:
+            self._gpu_support_cache[cache_key] = self._probe_gpu(use_gpu)
+        return self._gpu_support_cache[cache_key]
     
-    def _compress_with_amd(self, source_path, target_path, container_ext, encoder):
-        """使用AMD GPU编码压缩视频"""
-        cmd = self._build_amd_gpu_command(source_path, target_path, container_ext, encoder)
+    def _probe_gpu(self, use_gpu):
+        """
+        探测GPU编码能力
+        
+        依次检查：FFmpeg是否包含硬件编码器、是否支持对应的-hwaccel方式、
+        能否实际编码一帧测试画面（确认硬件和驱动存在）
+        """
+        backend = self.GPU_BACKENDS.get(use_gpu)
+        if not backend:
+            return False
+        
+        encoder = backend['encoder']
+        if encoder not in self.encoder_compat.get_available_encoders():
+            self.logger.info(f"FFmpeg不支持 {encoder} 编码器")
+            return False
+        
+        if backend['hwaccel'] not in self._get_hwaccels():
+            self.logger.info(f"FFmpeg不支持 {backend['hwaccel']} 硬件加速")
+            return False
         
-        self.logger.info(f"使用AMD GPU加速压缩视频: {source_path}")
         try:
+            cmd = [
+                self.ffmpeg_path,
+                '-hide_banner',
+                '-v', 'error',
+                '-f', 'lavfi',
+                '-i', 'color=c=black:s=256x256:d=0.04',
+                '-frames:v', '1',
+                '-c:v', encoder,
+                '-f', 'null',
+                '-'
+            ]
             result = subprocess.run(
                 cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                check=True,
+                timeout=10,
                 shell=False,
-                creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+                creationflags=self.CREATIONFLAGS
             )
-            self.logger.info(f"AMD GPU视频压缩成功: {source_path} -> {target_path}")
-            return True
-        except subprocess.CalledProcessError as e:
-            error_msg = e.stderr.decode('utf-8', errors='ignore') if e.stderr else str(e)
-            self.logger.warning(f"AMD GPU编码失败，回退到CPU编码: {source_path}, 错误: {error_msg}")
-            
-            # 回退到CPU编码
-            cpu_encoder = self._get_encoder_for_container(container_ext, 'cpu')
-            if not cpu_encoder:
-                self.logger.error(f"无法为容器格式 {container_ext} 找到CPU编码器")
-                return False
-            cmd = self._build_cpu_command(source_path, target_path, container_ext, cpu_encoder)
+            if result.returncode == 0:
+                self.logger.info(f"检测到 {use_gpu} GPU编码可用（{encoder}）")
+                return True
+            error_output = result.stderr.decode('utf-8', errors='ignore')
+            self.logger.info(f"{encoder} 测试编码失败，GPU不可用: {error_output[:200]}")
+        except Exception as e:
+            self.logger.debug(f"探测 {use_gpu} GPU时出错: {e}")
+        return False
+    
+    def _get_hwaccels(self):
+        """获取FFmpeg支持的硬件加速方式列表"""
+        try:
             result = subprocess.run(
-                cmd,
+                [self.ffmpeg_path, '-hide_banner', '-hwaccels'],
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                check=True,
+                timeout=5,
                 shell=False,
-                creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+                creationflags=self.CREATIONFLAGS
             )
-            self.logger.info(f"CPU视频压缩成功: {source_path} -> {target_path}")
+            if result.returncode != 0:
+                return []
+            lines = result.stdout.decode('utf-8', errors='ignore').splitlines()
+            # 第一行为标题"Hardware acceleration methods:"
+            return [line.strip() for line in lines[1:] if line.strip()]
+        except Exception as e:
+            self.logger.debug(f"获取硬件加速列表失败: {e}")
+            return []
+    
+    def _run_ffmpeg(self, cmd):
+        """
+        执行FFmpeg命令
+        
+        Args:
+            cmd: FFmpeg命令参数列表
+            
+        Returns:
+            (是否成功, 错误输出)
+        """
+        # 命令最后一个参数为输出文件路径，确保其目录存在
+        self._ensure_dir(os.path.dirname(cmd[-1]))
+        
+        self.logger.debug(f"执行FFmpeg命令: {' '.join(cmd)}")
+        result = subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            shell=False,
+            creationflags=self.CREATIONFLAGS
+        )
+        stderr = result.stderr.decode('utf-8', errors='ignore') if result.stderr else ''
+        return result.returncode == 0, stderr
+    
+    def _ensure_dir(self, target_dir):
+        """确保目录存在（已确认存在的目录不再重复调用makedirs）"""
+        if not target_dir or target_dir in self._known_dirs:
+            return
+        os.makedirs(target_dir, exist_ok=True)
+        self._known_dirs.add(target_dir)
+    
+    def _compress_with_cpu(self, source_path, target_path, container_ext, encoder, vf_chain=None):
+        """使用CPU编码压缩视频"""
+        cmd = self._build_cpu_command(source_path, target_path, container_ext, encoder, vf_chain)
+        
+        self.logger.info(f"使用CPU压缩视频: {source_path}")
+        ok, stderr = self._run_ffmpeg(cmd)
+        if not ok:
+            raise RuntimeError(f"CPU视频压缩失败: {stderr}")
+        self.logger.info(f"CPU视频压缩成功: {source_path} -> {target_path}")
+        return True
+    
+    def _compress_with_amd(self, source_path, target_path, container_ext, encoder, vf_chain=None):
+        """使用AMD GPU编码压缩视频"""
+        cmd = self._build_amd_gpu_command(source_path, target_path, container_ext, encoder, vf_chain)
+        
+        self.logger.info(f"使用AMD GPU加速压缩视频: {source_path}")
+        ok, stderr = self._run_ffmpeg(cmd)
+        if ok:
+            self.logger.info(f"AMD GPU视频压缩成功: {source_path} -> {target_path}")
             return True
+        
+        self.logger.warning(f"AMD GPU编码失败，回退到CPU编码: {source_path}, 错误: {stderr}")
+        return self._fallback_to_cpu(source_path, target_path, container_ext, vf_chain)
     
-    def _compress_with_nvidia(self, source_path, target_path, container_ext, encoder):
+    def _compress_with_nvidia(self, source_path, target_path, container_ext, encoder, vf_chain=None):
         """使用Nvidia GPU编码压缩视频"""
-        cmd = self._build_nvidia_gpu_command(source_path, target_path, container_ext, encoder)
+        cmd = self._build_nvidia_gpu_command(source_path, target_path, container_ext, encoder, vf_chain)
         
         self.logger.info(f"使用Nvidia GPU加速压缩视频: {source_path}")
-        try:
-            result = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                check=True,
-                shell=False,
-                creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
-            )
+        ok, stderr = self._run_ffmpeg(cmd)
+        if ok:
             self.logger.info(f"Nvidia GPU视频压缩成功: {source_path} -> {target_path}")
             return True
-        except subprocess.CalledProcessError as e:
-            error_msg = e.stderr.decode('utf-8', errors='ignore') if e.stderr else str(e)
-            self.logger.warning(f"Nvidia GPU编码失败，回退到CPU编码: {source_path}, 错误: {error_msg}")
+        
+        self.logger.warning(f"Nvidia GPU编码失败，回退到CPU编码: {source_path}, 错误: {stderr}")
+        return self._fallback_to_cpu(source_path, target_path, container_ext, vf_chain)
+    
+    def _fallback_to_cpu(self, source_path, target_path, container_ext, vf_chain=None):
+        """
+        GPU编码失败后回退到CPU编码
+        
+        始终从原始源文件重新编码，不使用GPU编码写了一半的目标文件
+        """
+        cpu_encoder = self._get_encoder_for_container(container_ext, 'cpu')
+        if not cpu_encoder:
+            self.logger.error(f"无法为容器格式 {container_ext} 找到CPU编码器")
+            return False
+        return self._compress_with_cpu(source_path, target_path, container_ext, cpu_encoder, vf_chain)
+    
+    def _get_ffprobe_path(self):
+        """根据FFmpeg路径推断ffprobe路径"""
+        ffmpeg_dir, ffmpeg_name = os.path.split(self.ffmpeg_path or 'ffmpeg')
+        return os.path.join(ffmpeg_dir, ffmpeg_name.replace('ffmpeg', 'ffprobe'))
+    
+    def _probe_video(self, source_path):
+        """
+        获取源视频流信息（结果按文件路径、修改时间和大小缓存）
+        
+        Args:
+            source_path: 源文件路径
             
-            # 回退到CPU编码
-            cpu_encoder = self._get_encoder_for_container(container_ext, 'cpu')
-            if not cpu_encoder:
-                self.logger.error(f"无法为容器格式 {container_ext} 找到CPU编码器")
-                return False
-            cmd = self._build_cpu_command(source_path, target_path, container_ext, cpu_encoder)
+        Returns:
+            视频信息字典（width, height, fps, codec_name, bit_depth, bit_rate, format_name），
+            获取失败时返回空字典
+        """
+        try:
+            st = os.stat(source_path)
+        except OSError:
+            return {}
+        cache_key = (source_path, st.st_mtime_ns, st.st_size)
+        if cache_key in self._probe_cache:
+            return self._probe_cache[cache_key]
+        
+        info = {}
+        try:
+            cmd = [
+                self._get_ffprobe_path(),
+                '-v', 'error',
+                '-select_streams', 'v:0',
+                '-show_entries',
+                'stream=codec_name,width,height,avg_frame_rate,bits_per_raw_sample,pix_fmt,bit_rate'
+                ':format=format_name,bit_rate',
+                '-of', 'json',
+                source_path
+            ]
             result = subprocess.run(
                 cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                check=True,
+                timeout=10,
                 shell=False,
-                creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+                creationflags=self.CREATIONFLAGS
             )
-            self.logger.info(f"CPU视频压缩成功: {source_path} -> {target_path}")
-            return True
+            if result.returncode == 0:
+                data = json.loads(result.stdout.decode('utf-8', errors='ignore') or '{}')
+                streams = data.get('streams') or [{}]
+                stream = streams[0]
+                fmt = data.get('format', {})
+                
+                fps = 0.0
+                num, _, den = (stream.get('avg_frame_rate') or '0/1').partition('/')
+                if num and den and float(den) != 0:
+                    fps = float(num) / float(den)
+                
+                bit_depth = int(stream.get('bits_per_raw_sample') or 0)
+                if not bit_depth:
+                    pix_fmt = stream.get('pix_fmt', '')
+                    bit_depth = 12 if '12' in pix_fmt else 10 if '10' in pix_fmt else 8
+                
+                info = {
+                    'width': int(stream.get('width') or 0),
+                    'height': int(stream.get('height') or 0),
+                    'fps': fps,
+                    'codec_name': stream.get('codec_name', ''),
+                    'bit_depth': bit_depth,
+                    'bit_rate': int(stream.get('bit_rate') or fmt.get('bit_rate') or 0),
+                    'format_name': fmt.get('format_name', '')
+                }
+        except Exception as e:
+            self.logger.debug(f"获取视频信息失败: {source_path}, 错误: {e}")
+        
+        self._probe_cache[cache_key] = info
+        return info
+    
+    def _select_nvenc_preset(self, encoder, width, height, priority):
+        """
+        根据源分辨率和速度/质量优先级选择NVENC预设
+        
+        Args:
+            encoder: NVENC编码器名称
+            width: 源视频宽度
+            height: 源视频高度
+            priority: 质量优先级（'speed', 'balanced', 'size'）
+            
+        Returns:
+            (preset, tune, split_encode_mode)，split_encode_mode为0表示不设置
+        """
+        if priority == 'speed':
+            if width * height >= self.UHD_PIXELS and encoder in self.NVENC_SPLIT_ENCODERS:
+                # 大分辨率源：最快预设 + 低延迟调优 + 强制分片编码（多NVENC并行）
+                return 'p1', 'll', 4
+            return 'p1', 'll', 0
+        return self.config.get('nvidia_preset', 'p4'), 'hq', 0
+    
+    def _build_filter_args(self, vf_chain, use_gpu='cpu'):
+        """
+        构建-vf滤镜参数
+        
+        Args:
+            vf_chain: 视频滤镜列表
+            use_gpu: GPU模式，GPU模式下滤镜替换为对应的硬件实现
+            
+        Returns:
+            FFmpeg参数列表（无滤镜时为空列表）
+        """
+        if not vf_chain:
+            return []
+        hw_filters = self.HW_FILTERS.get(use_gpu, {})
+        filters = []
+        for vf in vf_chain:
+            name, sep, args = vf.partition('=')
+            filters.append(hw_filters.get(name, name) + sep + args)
+        return ['-vf', ','.join(filters)]
+    
+    def _select_pix_fmt(self, encoder, source_path):
+        """
+        选择输出像素格式
+        
+        开启preserve_bitdepth时，10位源视频使用编码器原生的10位格式，
+        避免逐帧转换为8位并保留HDR精度
+        
+        Args:
+            encoder: 视频编码器名称
+            source_path: 源文件路径
+            
+        Returns:
+            像素格式名称，None表示不指定
+        """
+        high_bitdepth_fmt = self.HIGH_BITDEPTH_PIX_FMTS.get(encoder)
+        if high_bitdepth_fmt and self.config.get('preserve_bitdepth', True):
+            if self._probe_video(source_path).get('bit_depth', 8) >= 10:
+                return high_bitdepth_fmt
+        if encoder in ['libx264', 'libx265', 'h264_amf', 'hevc_amf']:
+            return 'yuv420p'
+        return None
+    
+    def _build_container_args(self, container_ext):
+        """
+        构建容器格式相关的FFmpeg参数
+        
+        Args:
+            container_ext: 容器格式扩展名
+            
+        Returns:
+            FFmpeg参数列表
+        """
+        if container_ext != '.mp4':
+            return []
+        if self.config.get('mp4_fragmented', False):
+            # 分片MP4：moov在文件头部为空，编码结束后无需再次读写整个文件移动moov
+            return ['-movflags', '+frag_keyframe+empty_moov+default_base_moof']
+        # 普通MP4：faststart需要编码后重写文件，不写入多余的时间码轨道
+        return ['-movflags', '+faststart', '-write_tmcd', '0']
     
-    def _build_cpu_command(self, source_path, target_path, container_ext, encoder):
+    def _threads_per_job(self):
+        """
+        计算每个CPU编码任务可用的线程数
+        
+        Returns:
+            CPU核心数除以配置的并行任务数（至少为1）；
+            并行任务数为0（自动）时返回None，由FFmpeg自行决定线程数
+        """
+        max_parallel_jobs = self.config.get('max_parallel_jobs', 0)
+        if not max_parallel_jobs:
+            # 自动模式下并不知道实际同时运行的任务数（例如Web单文件压缩只有一个任务），不限制线程
+            return None
+        cpu_count = os.cpu_count() or 1
+        return max(1, cpu_count // max_parallel_jobs)
+    
+    def _build_cpu_command(self, source_path, target_path, container_ext, encoder, vf_chain=None):
         """构建CPU编码的FFmpeg命令"""
         video_crf = self.config.get('video_crf', 23)
         video_preset = self.config.get('video_preset', 'medium')
         audio_encoder = self.config.get('audio_encoder', 'aac')
         
+        # 速度/体积优先时使用对应编码器的预设
+        quality_priority = self.config.get('quality_priority', 'balanced')
+        profile = self.CPU_PRIORITY_PROFILES.get(quality_priority)
+        if profile and profile[0] == encoder:
+            video_preset = profile[1]
+        
         # 获取容器格式兼容的音频编码器
-        compatible_audio = self.encoder_compat.get_compatible_audio_codecs(container_ext, encoder)
-        if audio_encoder not in compatible_audio:
-            audio_encoder = compatible_audio[0] if compatible_audio else 'aac'
+        audio_encoder = _audio_for(container_ext, encoder, audio_encoder)
         
         normalized_source = self._normalize_path(source_path)
         if not normalized_source:
@@ -264,7 +730,14 @@ class VideoCompressor:
                 # VP9使用CRF模式
                 cmd.extend(['-crf', str(video_crf)])
                 cmd.extend(['-b:v', '0'])
-            elif encoder in ['libaom-av1', 'libsvtav1']:
+            elif encoder == 'libsvtav1':
+                # SVT-AV1的预设为0-13的数字，不能使用x264的预设名称
+                if quality_priority == 'size':
+                    video_crf = self.SVTAV1_SIZE_CRF
+                cmd.extend(['-crf', str(video_crf)])
+                cmd.extend(['-preset', '8'])
+                cmd.extend(['-svtav1-params', 'tune=0'])
+            elif encoder == 'libaom-av1':
                 # AV1使用CRF模式
                 cmd.extend(['-crf', str(video_crf)])
         elif encoder_info.get('bitrate_mode'):
@@ -272,35 +745,35 @@ class VideoCompressor:
             video_bitrate = self.config.get('video_bitrate', '5000k')
             cmd.extend(['-b:v', video_bitrate])
         
+        # 配置了并行任务数时按任务数分配编码线程，避免多个编码器争抢同一批核心
+        threads = self._threads_per_job()
+        if threads is not None:
+            cmd.extend(['-threads', str(threads)])
+        
+        cmd.extend(self._build_filter_args(vf_chain))
+        
         # 设置像素格式
-        if encoder in ['libx264', 'libx265', 'h264_amf', 'hevc_amf', 'h264_nvenc', 'hevc_nvenc']:
-            cmd.extend(['-pix_fmt', 'yuv420p'])
+        pix_fmt = self._select_pix_fmt(encoder, normalized_source)
+        if pix_fmt:
+            cmd.extend(['-pix_fmt', pix_fmt])
         
         # 设置音频比特率
-        if audio_encoder == 'aac':
-            cmd.extend(['-b:a', '128k'])
-        elif audio_encoder == 'opus':
-            cmd.extend(['-b:a', '128k'])
+        if audio_encoder in _AUDIO_BITRATE:
+            cmd.extend(['-b:a', _AUDIO_BITRATE[audio_encoder]])
         
-        # MP4格式优化
-        if container_ext == '.mp4':
-            cmd.extend(['-movflags', 'faststart'])
+        cmd.extend(self._build_container_args(container_ext))
         
-        target_dir = os.path.dirname(target_path)
-        os.makedirs(target_dir, exist_ok=True)
         cmd.append(target_path)
         
         return cmd
     
-    def _build_amd_gpu_command(self, source_path, target_path, container_ext, encoder):
+    def _build_amd_gpu_command(self, source_path, target_path, container_ext, encoder, vf_chain=None):
         """构建AMD GPU加速编码的FFmpeg命令"""
         amd_video_bitrate = self.config.get('amd_video_bitrate', '5000k')
         audio_encoder = self.config.get('audio_encoder', 'aac')
         
         # 获取容器格式兼容的音频编码器
-        compatible_audio = self.encoder_compat.get_compatible_audio_codecs(container_ext, encoder)
-        if audio_encoder not in compatible_audio:
-            audio_encoder = compatible_audio[0] if compatible_audio else 'aac'
+        audio_encoder = _audio_for(container_ext, encoder, audio_encoder)
         
         normalized_source = self._normalize_path(source_path)
         if not normalized_source:
@@ -310,50 +783,48 @@ class VideoCompressor:
         if not normalized_target:
             raise ValueError(f"无效的目标路径: {target_path}")
         
-        cmd = [
-            self.ffmpeg_path,
-            '-hwaccel', 'd3d11va',
+        cmd = [self.ffmpeg_path, '-hwaccel', 'd3d11va']
+        if vf_chain:
+            # 有滤镜时解码输出保留在显存中，由scale_amf等滤镜直接处理
+            cmd.extend(['-hwaccel_output_format', 'd3d11'])
+        cmd.extend([
             '-i', normalized_source,
             '-c:v', encoder,
             '-b:v', amd_video_bitrate,
             '-c:a', audio_encoder,
-            '-pix_fmt', 'yuv420p',
             '-y'
-        ]
+        ])
+        pix_fmt = self._select_pix_fmt(encoder, normalized_source)
+        if vf_chain:
+            cmd.extend(self._build_filter_args(vf_chain, 'amd'))
+        else:
+            cmd.extend(['-pix_fmt', pix_fmt])
         
         # AMF编码器特定参数
         if encoder == 'h264_amf':
             cmd.extend(['-usage', 'transcoding'])
         elif encoder == 'hevc_amf':
-            cmd.extend(['-usage', 'transcoding', '-profile:v', 'main'])
+            hevc_profile = 'main10' if pix_fmt == 'p010le' else 'main'
+            cmd.extend(['-usage', 'transcoding', '-profile:v', hevc_profile])
         
         # 设置音频比特率
-        if audio_encoder == 'aac':
-            cmd.extend(['-b:a', '128k'])
-        elif audio_encoder == 'opus':
-            cmd.extend(['-b:a', '128k'])
+        if audio_encoder in _AUDIO_BITRATE:
+            cmd.extend(['-b:a', _AUDIO_BITRATE[audio_encoder]])
         
-        # MP4格式优化
-        if container_ext == '.mp4':
-            cmd.extend(['-movflags', 'faststart'])
+        cmd.extend(self._build_container_args(container_ext))
         
-        target_dir = os.path.dirname(target_path)
-        os.makedirs(target_dir, exist_ok=True)
         cmd.append(target_path)
         
         return cmd
     
-    def _build_nvidia_gpu_command(self, source_path, target_path, container_ext, encoder):
+    def _build_nvidia_gpu_command(self, source_path, target_path, container_ext, encoder, vf_chain=None):
         """构建Nvidia GPU加速编码的FFmpeg命令"""
-        nvidia_preset = self.config.get('nvidia_preset', 'p4')
         nvidia_video_bitrate = self.config.get('nvidia_video_bitrate', '5000k')
         nvidia_rc = self.config.get('nvidia_rc', 'cbr')
         audio_encoder = self.config.get('audio_encoder', 'aac')
         
         # 获取容器格式兼容的音频编码器
-        compatible_audio = self.encoder_compat.get_compatible_audio_codecs(container_ext, encoder)
-        if audio_encoder not in compatible_audio:
-            audio_encoder = compatible_audio[0] if compatible_audio else 'aac'
+        audio_encoder = _audio_for(container_ext, encoder, audio_encoder)
         
         normalized_source = self._normalize_path(source_path)
         if not normalized_source:
@@ -363,6 +834,14 @@ class VideoCompressor:
         if not normalized_target:
             raise ValueError(f"无效的目标路径: {target_path}")
         
+        # 根据源分辨率选择预设和调优参数
+        video_info = self._probe_video(normalized_source)
+        width = video_info.get('width', 0)
+        height = video_info.get('height', 0)
+        nvidia_preset, nvidia_tune, split_encode_mode = self._select_nvenc_preset(
+            encoder, width, height, self.config.get('quality_priority', 'balanced')
+        )
+        
         cmd = [
             self.ffmpeg_path,
             '-hwaccel', 'cuda',
@@ -370,40 +849,40 @@ class VideoCompressor:
             '-i', normalized_source,
             '-c:v', encoder,
             '-preset', nvidia_preset,
+            '-tune', nvidia_tune,
             '-rc', nvidia_rc,
             '-b:v', nvidia_video_bitrate,
             '-c:a', audio_encoder,
             '-y'
         ]
         
+        if split_encode_mode:
+            cmd.extend(['-split_encode_mode', str(split_encode_mode)])
+            # 4K HEVC：关闭自适应量化和前瞻，最大化编码吞吐量
+            if encoder == 'hevc_nvenc':
+                cmd.extend(['-spatial_aq', '0', '-temporal_aq', '0', '-rc-lookahead', '0'])
+        
+        # 吞吐量模式：加深NVENC输入队列，使解码和编码充分流水化
+        if self.config.get('nvidia_throughput_mode', False):
+            cmd.extend(['-surfaces', '32'])
+            if '-rc-lookahead' not in cmd:
+                cmd.extend(['-rc-lookahead', '20'])
+        
+        # 解码输出已在CUDA显存中且保持源格式（10位源即为P010），无需指定-pix_fmt；
+        # 滤镜使用scale_cuda等实现，帧不回传内存
+        cmd.extend(self._build_filter_args(vf_chain, 'nvidia'))
+        
         # 设置音频比特率
-        if audio_encoder == 'aac':
-            cmd.extend(['-b:a', '128k'])
-        elif audio_encoder == 'opus':
-            cmd.extend(['-b:a', '128k'])
+        if audio_encoder in _AUDIO_BITRATE:
+            cmd.extend(['-b:a', _AUDIO_BITRATE[audio_encoder]])
         
-        # MP4格式优化
-        if container_ext == '.mp4':
-            cmd.extend(['-movflags', 'faststart'])
+        cmd.extend(self._build_container_args(container_ext))
         
-        target_dir = os.path.dirname(target_path)
-        os.makedirs(target_dir, exist_ok=True)
         cmd.append(target_path)
         
         return cmd
     
-    @staticmethod
-    def _normalize_path(path):
-        """规范化路径"""
-        if not path:
-            return None
-        try:
-            from pathlib import Path
-            normalized = Path(path).resolve()
-            path_str = str(normalized)
-            if '..' in path_str or path_str.startswith('\\\\'):
-                return None
-            return str(normalized)
-        except (ValueError, OSError):
-            return None
+    def _normalize_path(self, path):
+        """规范化路径，并校验是否在配置的allowed_root目录内"""
+        return normalize_path(path, self.config.get('allowed_root', '') or None)
 
@@ -180,7 +180,7 @@ class CompressorApp {
         this.apiBase = window.location.origin;
         this.currentTaskId = null;
         this.currentMode = 'single';
-        this.pollInterval = null;
+        this.activePoll = null;
         this.currentFile = null;  // 当前上传的文件对象
         this.currentFileKey = null;  // 当前文件的缓存键
         this.fileCache = new FileCacheManager();  // 文件缓存管理器
@@ -529,6 +529,12 @@ class CompressorApp {
                 body: formData
             });
 
+            // 超过服务器上传上限时，waitress直接返回非JSON的413响应
+            if (response.status === 413) {
+                this.showError('上传文件过大，单次上传最大2GB');
+                return;
+            }
+
             const data = await response.json();
 
             if (response.ok) {
@@ -640,6 +646,12 @@ class CompressorApp {
                 body: formData
             });
 
+            // 超过服务器上传上限时，waitress直接返回非JSON的413响应
+            if (response.status === 413) {
+                this.showError('上传文件过大，单次上传最大2GB');
+                return;
+            }
+
             const data = await response.json();
 
             if (response.ok) {
@@ -773,14 +785,25 @@ class CompressorApp {
     }
 
     startPolling(taskId, mode) {
-        if (this.pollInterval) {
-            clearInterval(this.pollInterval);
-        }
+        // 长轮询：服务器在任务状态变化时（或30秒超时后）才返回，不再每秒请求一次
+        const pollId = {};
+        this.activePoll = pollId;
+        let rev = -1;
 
-        this.pollInterval = setInterval(async () => {
+        const poll = async () => {
+            if (this.activePoll !== pollId) {
+                return;
+            }
             try {
-                const response = await fetch(`${this.apiBase}${API_ENDPOINTS.TASK}/${taskId}`);
+                const response = await fetch(`${this.apiBase}${API_ENDPOINTS.TASK}/${taskId}/wait?rev=${rev}`);
                 const task = await response.json();
+                if (this.activePoll !== pollId) {
+                    return;
+                }
+                if (!response.ok) {
+                    throw new Error(task.error || response.statusText);
+                }
+                rev = task.rev;
 
                 if (mode === 'single') {
                     this.updateSingleProgress(task);
@@ -789,13 +812,16 @@ class CompressorApp {
                 }
 
                 if (task.status === 'completed' || task.status === 'failed' || task.status === 'partial') {
-                    clearInterval(this.pollInterval);
-                    this.pollInterval = null;
+                    this.activePoll = null;
+                    return;
                 }
+                poll();
             } catch (error) {
                 console.error('轮询错误:', error);
+                setTimeout(poll, 1000);
             }
-        }, 1000);
+        };
+        poll();
     }
 
     updateSingleProgress(task) {
@@ -919,8 +945,8 @@ class CompressorApp {
         const isImage = FILE_EXTENSIONS.IMAGE.includes(fileExt.toLowerCase());
         const isVideo = FILE_EXTENSIONS.VIDEO.includes(fileExt.toLowerCase());
         
-        // 压缩后替换预览窗口为滑块对比预览（如果是图片或视频）
-        if ((isImage || isVideo) && task.preview_original_url && task.preview_compressed_url) {
+        // 压缩后替换预览窗口为滑块对比预览（如果是图片或视频；原始文件从客户端缓存读取）
+        if ((isImage || isVideo) && task.preview_compressed_url) {
             // 先缓存压缩后的文件，然后加载预览
             if (task.download_url) {
                 this.cacheCompressedFile(this.currentTaskId, null, task.download_url, task.output_filename || task.filename, task.file_ext).then(() => {
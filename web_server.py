@@ -3,16 +3,25 @@ Web服务器模块
 提供HTTP API和Web界面，支持单文件和批量文件压缩
 """
 import os
+import io
 import sys
 import threading
 import logging
 import tempfile
 import shutil
-import json
 import time
+import hashlib
+import hmac
+import secrets
+import queue
+import heapq
+import itertools
 import subprocess
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
 from pathlib import Path
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, Response, json, request, jsonify, make_response, send_from_directory, stream_with_context
 try:
     from flask_cors import CORS
 except ImportError:
@@ -21,7 +30,26 @@ except ImportError:
         def __init__(self, app):
             pass
 from werkzeug.utils import secure_filename
+from urllib.parse import quote
 from werkzeug.serving import make_server
+from werkzeug.http import is_resource_modified
+from werkzeug.exceptions import NotFound, RequestEntityTooLarge
+try:
+    # 安装了orjson时用它序列化JSON响应（任务状态轮询返回的数据量较大）
+    import orjson
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:
+    orjson = None
+try:
+    # 生产模式使用waitress（支持wsgi.file_wrapper，下载时不在Python中逐块复制）
+    from waitress.server import create_server
+except ImportError:
+    create_server = None
+try:
+    # 安装了nvidia-ml-py时直接通过NVML查询NVENC，不需要启动FFmpeg试编码
+    import pynvml
+except ImportError:
+    pynvml = None
 
 # 导入自定义模块
 from config_manager import ConfigManager
@@ -36,10 +64,187 @@ from path_utils import get_v2_dir
 v2_dir = get_v2_dir()
 
 # 支持的文件扩展名
-ALLOWED_IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp'}
-ALLOWED_VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.m4v', '.webm', '.3gp'}
+ALLOWED_IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp'})
+ALLOWED_VIDEO_EXTENSIONS = frozenset({'.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.m4v', '.webm', '.3gp'})
 ALLOWED_EXTENSIONS = ALLOWED_IMAGE_EXTENSIONS | ALLOWED_VIDEO_EXTENSIONS
 
+# 扩展名 -> 文件类型（'image'/'video'），不支持的扩展名不在表中
+EXT_KIND = {
+    **{ext: 'image' for ext in ALLOWED_IMAGE_EXTENSIONS},
+    **{ext: 'video' for ext in ALLOWED_VIDEO_EXTENSIONS}
+}
+
+# 扩展名 -> 预览时使用的MIME类型（包含所有支持的扩展名）
+MIMETYPE_MAP = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.bmp': 'image/bmp',
+    '.tiff': 'image/tiff',
+    '.tif': 'image/tiff',
+    '.webp': 'image/webp',
+    '.mp4': 'video/mp4',
+    '.avi': 'video/x-msvideo',
+    '.mov': 'video/quicktime',
+    '.mkv': 'video/x-matroska',
+    '.wmv': 'video/x-ms-wmv',
+    '.flv': 'video/x-flv',
+    '.m4v': 'video/mp4',
+    '.webm': 'video/webm',
+    '.3gp': 'video/3gpp'
+}
+
+# 扩展名 -> (文件类型, MIME类型)，预览时一次查表得到两者
+EXT_INFO = {ext: (kind, MIMETYPE_MAP[ext]) for ext, kind in EXT_KIND.items()}
+
+
+def _classify(file_path):
+    """
+    根据扩展名判断文件类型
+    
+    Args:
+        file_path: 文件路径
+        
+    Returns:
+        (文件类型'image'/'video', MIME类型)，不支持的扩展名返回(None, None)
+    """
+    return EXT_INFO.get(os.path.splitext(file_path)[1].lower(), (None, None))
+
+
+# 允许前端修改的配置项（不包含GPU配置，GPU由服务器自动检测）
+ALLOWED_SETTING_KEYS = frozenset({
+    'photo_quality', 'video_crf', 'video_preset',
+    'max_photo_width', 'max_photo_height', 'resolution_preset'
+})
+
+# nginx内部location前缀（X-Accel-Redirect模式），需在nginx中分别映射到输出目录和上传目录：
+#   location /protected-downloads/ { internal; alias /path/to/web/outputs/; sendfile on; tcp_nopush on; }
+#   location /protected-uploads/ { internal; alias /path/to/web/uploads/; sendfile on; tcp_nopush on; }
+X_ACCEL_PREFIX = '/protected-downloads/'
+X_ACCEL_UPLOAD_PREFIX = '/protected-uploads/'
+
+# 下载和预览令牌的时间窗口（5分钟，纳秒）
+TOKEN_WINDOW_NS = 300 * 10**9
+
+# GPU检测结果写入配置文件后的有效期（秒）
+GPU_DETECT_TTL = 24 * 60 * 60
+
+# web_config.ini中保存GPU检测结果的配置段（只属于Web服务器，不进入ConfigManager的通用配置）
+GPU_DETECT_SECTION = 'WebGPUDetect'
+
+# 前端设置写入配置文件前的合并等待时间（秒）
+SETTINGS_SAVE_DEBOUNCE = 0.2
+
+# 开始压缩前等待设置生效的最长时间（秒）
+SETTINGS_APPLY_TIMEOUT = 5.0
+
+# 保存上传文件时的复制缓冲区大小
+UPLOAD_COPY_BUFFER = 8 * 1024 * 1024
+
+# 批量上传时同时保存的文件数
+UPLOAD_SAVE_WORKERS = 4
+
+# 使用GPU编码时同时运行的视频压缩数（消费级显卡的硬件编码会话数有限，多开只会排队或失败）
+GPU_MAX_PARALLEL_JOBS = 2
+
+# 流式打包ZIP时每次读取的大小
+ZIP_STREAM_CHUNK = 1024 * 1024
+
+# 长轮询/SSE等待任务状态变化的最长时间（秒）
+TASK_WAIT_TIMEOUT = 30.0
+
+# GPU检测顺序：(GPU类型, -encoders输出中的编码器名, 试编码参数, 表示硬件不存在的错误关键字)
+_GPU_ERROR_KEYWORDS = ('no device', 'no hardware', 'could not find', 'failed to initialize')
+GPU_PROBES = (
+    ('nvidia', (b'h264_nvenc', b'hevc_nvenc'), ('-c:v', 'h264_nvenc', '-preset', 'fast'),
+     _GPU_ERROR_KEYWORDS + ('no nvenc device', 'no nvenc capable devices found',
+                            'no nvenc capable device found', 'no nvenc devices found')),
+    ('amd', (b'h264_amf', b'hevc_amf'), ('-c:v', 'h264_amf'),
+     _GPU_ERROR_KEYWORDS + ('no amf device', 'no amf capable devices found',
+                            'no amf capable device found')),
+)
+
+# waitress的默认工作线程数（可通过WebServer的threads参数修改）
+# 这是同时处理请求数的上限：每个长轮询（/wait）请求最多占用一个线程TASK_WAIT_TIMEOUT秒，
+# 每个SSE（/stream）连接在任务结束前一直占用一个线程，打开的客户端较多时需要相应调大
+WAITRESS_THREADS = 16
+
+
+if orjson is not None:
+    class _OrjsonProvider(DefaultJSONProvider):
+        """使用orjson的Flask JSON提供器"""
+        
+        def dumps(self, obj, **kwargs):
+            option = orjson.OPT_SORT_KEYS if self.sort_keys else 0
+            return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+        
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+
+class _ZipStreamBuffer(io.RawIOBase):
+    """
+    流式ZIP的输出缓冲区
+    
+    zipfile写入的数据暂存在这里，由生成器取出发送给客户端。
+    不支持seek，zipfile会自动改用数据描述符记录文件大小和CRC。
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def pop(self):
+        """取出已写入的数据"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class _FileReaper:
+    """
+    延迟删除文件的后台线程
+    
+    所有待删除文件按到期时间放在一个堆中，由同一个线程等待并删除，
+    不再为每次下载单独创建一个Timer线程。
+    """
+    
+    def __init__(self, delete_func):
+        """
+        Args:
+            delete_func: 删除文件的函数，参数为文件路径
+        """
+        self._delete_func = delete_func
+        self._heap = []  # (到期时间, 文件路径)
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='file-reaper')
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def schedule(self, path, delay):
+        """安排在delay秒后删除文件"""
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, path))
+            self._cond.notify()
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._cond.wait(timeout)
+                _, path = heapq.heappop(self._heap)
+            # 在锁外删除文件，不阻塞schedule()
+            self._delete_func(path)
+
 
 class WebServer:
     """Web服务器类"""
@@ -85,7 +290,11 @@ class WebServer:
         }
     }
     
-    def __init__(self, logger=None, host='0.0.0.0', port=5000):
+    # GPU检测结果缓存（ffmpeg_path -> 'nvidia'/'amd'/None），硬件在进程运行期间不会变化，所有实例共享
+    _detected_gpu_cache = {}
+    
+    def __init__(self, logger=None, host='0.0.0.0', port=5000, production=None, use_x_sendfile=False,
+                 use_x_accel=False, threads=WAITRESS_THREADS):
         """
         初始化Web服务器
         
@@ -93,10 +302,17 @@ class WebServer:
             logger: 日志记录器
             host: 服务器地址
             port: 服务器端口
+            production: 是否使用waitress作为服务器；默认None表示安装了waitress就使用，False强制使用开发服务器
+            use_x_sendfile: 是否由前端服务器发送文件（需要Apache mod_xsendfile等支持X-Sendfile的反向代理）
+            use_x_accel: 是否通过X-Accel-Redirect交给nginx发送下载和预览文件（也可设置环境变量USE_X_ACCEL=1）
+            threads: waitress的工作线程数（长轮询和SSE请求会一直占用线程，见WAITRESS_THREADS）
         """
         self.logger = logger or logging.getLogger('FileCompressor.WebServer')
         self.host = host
         self.port = port
+        self.production = production
+        self.threads = threads
+        self.use_x_accel = use_x_accel or os.environ.get('USE_X_ACCEL') == '1'
         self.server = None
         self.server_thread = None
         self.is_running = False
@@ -124,18 +340,28 @@ class WebServer:
         
         # 当前使用的配置预设
         self.current_preset = 'balanced'
+        # 很少变化的配置接口响应体（(接口, 状态) -> 编码后的JSON）
+        self._json_cache = {}
         
         # 创建Flask应用
         self.app = Flask(__name__, 
                         static_folder=os.path.join(v2_dir, 'web', 'static'),
                         template_folder=os.path.join(v2_dir, 'web', 'templates'))
         CORS(self.app)  # 允许跨域请求
+        if orjson is not None:
+            # app.json需要Flask 2.2+；flask.json.dumps/loads在请求中会使用这里设置的提供器，低版本Flask下使用默认实现
+            self.app.json = _OrjsonProvider(self.app)
+        
+        # 由反向代理读取X-Sendfile头发送文件，Python只返回空响应
+        self.app.use_x_sendfile = use_x_sendfile
         
         # 配置上传目录
         self.upload_dir = os.path.join(v2_dir, 'web', 'uploads')
         self.output_dir = os.path.join(v2_dir, 'web', 'outputs')
         os.makedirs(self.upload_dir, exist_ok=True)
         os.makedirs(self.output_dir, exist_ok=True)
+        # 输出文件路径前缀，生成输出路径时直接拼接，避免每个文件调用os.path.join
+        self._output_prefix = os.path.join(self.output_dir, 'compressed_')
         
         # 设置上传配置
         self.app.config['MAX_CONTENT_LENGTH'] = 2 * 1024 * 1024 * 1024  # 2GB最大文件大小
@@ -147,10 +373,43 @@ class WebServer:
         
         # 任务状态存储
         self.tasks = {}  # task_id -> task_info
+        self._tasks_lock = threading.Lock()
+        # 任务状态变化时通知长轮询/SSE请求（每次变化任务的rev加1）
+        self._tasks_changed = threading.Condition(self._tasks_lock)
+        # 令牌签名密钥（每次启动随机生成，外部无法根据任务ID和文件名伪造令牌）
+        self._token_key = secrets.token_bytes(32)
+        # 相同文件、相同设置的压缩结果（(内容哈希, 扩展名, 设置) -> (输出路径, 文件标识)），由_tasks_lock保护
+        self._dedup = {}
+        # 任务ID和上传文件名的序号（同一秒内的多次上传也不会重名；next()在CPython中是原子操作）
+        self._id_counter = itertools.count()
+        
+        # 压缩任务线程池：限制同时运行的压缩数量，其余任务排队等待
+        self.executor = self._create_executor()
+        # GPU视频编码的并发限制（CPU编码和图片压缩不受限制）
+        self._gpu_slots = threading.BoundedSemaphore(GPU_MAX_PARALLEL_JOBS)
+        # 批量上传的保存线程池（与压缩线程池分开，保存文件不会排在耗时的压缩任务后面）
+        self._upload_executor = ThreadPoolExecutor(
+            max_workers=UPLOAD_SAVE_WORKERS, thread_name_prefix='upload'
+        )
+        
+        # 前端提交的设置由单独的线程应用和保存，不阻塞上传请求
+        self._settings_queue = queue.Queue()
+        settings_thread = threading.Thread(target=self._settings_worker, name='settings')
+        settings_thread.daemon = True
+        settings_thread.start()
+        
+        # 下载后延迟删除文件
+        self._reaper = _FileReaper(self._delete_file_after_download)
     
     def _register_routes(self):
         """注册路由"""
         
+        @self.app.errorhandler(413)
+        def request_too_large(e):
+            """上传超过MAX_CONTENT_LENGTH时返回JSON错误（waitress按同样的上限直接拒绝请求）"""
+            limit_gb = self.app.config['MAX_CONTENT_LENGTH'] / (1024 ** 3)
+            return jsonify({'error': f'上传文件过大，单次上传最大{limit_gb:g}GB'}), 413
+        
         @self.app.route('/')
         def index():
             """主页"""
@@ -177,19 +436,8 @@ class WebServer:
                 # 检查是否有设置更新请求
                 if request.form.get('settings'):
                     try:
-                        settings = json.loads(request.form.get('settings'))
-                        # 应用设置（不包含GPU配置）
-                        allowed_keys = {
-                            'photo_quality', 'video_crf', 'video_preset',
-                            'max_photo_width', 'max_photo_height', 'resolution_preset'
-                        }
-                        for key, value in settings.items():
-                            if key in allowed_keys and key in self.config_manager.defaults:
-                                self.config_manager.set(key, value)
-                        self.config_manager.save()
-                        # 更新压缩器
-                        self.image_compressor = ImageCompressor(self.config_manager, self.logger)
-                        self.video_compressor = VideoCompressor(self.config_manager, self.logger)
+                        # 交给设置线程应用，不等待（下次压缩时生效）
+                        self._queue_settings(json.loads(request.form.get('settings')))
                     except Exception as e:
                         self.logger.warning(f"应用设置失败: {e}")
                 
@@ -202,41 +450,45 @@ class WebServer:
                 
                 # 检查文件扩展名
                 file_ext = os.path.splitext(file.filename)[1].lower()
-                if file_ext not in ALLOWED_EXTENSIONS:
+                if file_ext not in EXT_KIND:
                     return jsonify({
                         'error': f'不支持的文件格式: {file_ext}。支持的格式: {", ".join(ALLOWED_EXTENSIONS)}'
                     }), 400
                 
                 # 保存上传的文件
                 filename = secure_filename(file.filename)
-                timestamp = int(time.time())
-                upload_filename = f"{timestamp}_{filename}"
+                seq = next(self._id_counter)
+                upload_filename = f"{seq}_{filename}"
                 upload_path = os.path.join(self.upload_dir, upload_filename)
-                file.save(upload_path)
+                content_hash, upload_size = self._save_upload(file, upload_path)
                 
                 self.logger.info(f"Web上传文件: {filename} -> {upload_path}")
                 
                 # 创建任务ID（上传状态，等待确认）
-                task_id = f"single_{timestamp}"
+                task_id = f"single_{time.monotonic_ns():x}_{seq}"
                 
                 # 创建上传任务（等待确认压缩）
-                self.tasks[task_id] = {
+                self._add_task(task_id, {
                     'status': 'uploaded',  # 已上传，等待确认
                     'filename': filename,
                     'upload_path': upload_path,
                     'file_ext': file_ext,
-                    'upload_size': os.path.getsize(upload_path),
+                    'upload_size': upload_size,
+                    '_content_hash': content_hash,  # 内部状态，不返回给前端
                     'progress': 0
-                }
+                })
                 
                 return jsonify({
                     'task_id': task_id,
                     'filename': filename,
                     'file_ext': file_ext,
-                    'upload_size': os.path.getsize(upload_path),
+                    'upload_size': upload_size,
                     'message': '文件上传成功，请确认后开始压缩'
                 }), 200
                 
+            except RequestEntityTooLarge:
+                # 交给413错误处理返回明确的提示
+                raise
             except Exception as e:
                 self.logger.error(f"上传文件错误: {str(e)}")
                 return jsonify({'error': f'上传失败: {str(e)}'}), 500
@@ -248,19 +500,8 @@ class WebServer:
                 # 检查是否有设置更新请求
                 if request.form.get('settings'):
                     try:
-                        settings = json.loads(request.form.get('settings'))
-                        # 应用设置（不包含GPU配置）
-                        allowed_keys = {
-                            'photo_quality', 'video_crf', 'video_preset',
-                            'max_photo_width', 'max_photo_height', 'resolution_preset'
-                        }
-                        for key, value in settings.items():
-                            if key in allowed_keys and key in self.config_manager.defaults:
-                                self.config_manager.set(key, value)
-                        self.config_manager.save()
-                        # 更新压缩器
-                        self.image_compressor = ImageCompressor(self.config_manager, self.logger)
-                        self.video_compressor = VideoCompressor(self.config_manager, self.logger)
+                        # 交给设置线程应用，不等待（下次压缩时生效）
+                        self._queue_settings(json.loads(request.form.get('settings')))
                     except Exception as e:
                         self.logger.warning(f"应用设置失败: {e}")
                 
@@ -275,8 +516,8 @@ class WebServer:
                 valid_files = []
                 for file in files:
                     file_ext = os.path.splitext(file.filename)[1].lower()
-                    if file_ext in ALLOWED_EXTENSIONS:
-                        valid_files.append((file, file_ext))
+                    if file_ext in EXT_KIND:
+                        valid_files.append((file, secure_filename(file.filename), file_ext))
                     else:
                         self.logger.warning(f"跳过不支持的文件: {file.filename}")
                 
@@ -284,42 +525,53 @@ class WebServer:
                     return jsonify({'error': '没有有效的媒体文件'}), 400
                 
                 # 创建任务ID（上传状态，等待确认）
-                task_id = f"batch_{int(time.time())}"
+                seq = next(self._id_counter)
+                task_id = f"batch_{time.monotonic_ns():x}_{seq}"
+                
+                # 保存上传的文件（等待确认压缩），多个文件同时写入磁盘
+                upload_paths = [
+                    os.path.join(self.upload_dir, f"{seq}_{idx}_{filename}")
+                    for idx, (_, filename, _) in enumerate(valid_files)
+                ]
+                saved = self._upload_executor.map(
+                    self._save_upload, [file for file, _, _ in valid_files], upload_paths
+                )
                 
-                # 保存上传的文件（等待确认压缩）
                 uploaded_files = []
-                for idx, (file, file_ext) in enumerate(valid_files):
-                    filename = secure_filename(file.filename)
-                    timestamp = int(time.time())
-                    upload_filename = f"{timestamp}_{idx}_{filename}"
-                    upload_path = os.path.join(self.upload_dir, upload_filename)
-                    file.save(upload_path)
-                    
+                for (_, filename, file_ext), upload_path, (content_hash, upload_size) in zip(valid_files, upload_paths, saved):
                     uploaded_files.append({
                         'original_filename': filename,
                         'upload_path': upload_path,
                         'file_ext': file_ext,
-                        'upload_size': os.path.getsize(upload_path),
+                        'upload_size': upload_size,
+                        '_content_hash': content_hash,  # 内部状态，不返回给前端
                         'status': 'uploaded'
                     })
                     self.logger.info(f"Web批量上传文件: {filename}")
                 
                 # 创建上传任务（等待确认）
-                self.tasks[task_id] = {
+                self._add_task(task_id, {
                     'status': 'uploaded',  # 已上传，等待确认
                     'total': len(uploaded_files),
                     'completed': 0,
                     'failed': 0,
                     'files': uploaded_files
-                }
+                })
                 
                 return jsonify({
                     'task_id': task_id,
                     'total': len(uploaded_files),
-                    'files': uploaded_files,
+                    # 下划线开头的字段只在服务器内部使用，不返回给前端
+                    'files': [
+                        {key: value for key, value in file_info.items() if not key.startswith('_')}
+                        for file_info in uploaded_files
+                    ],
                     'message': f'{len(uploaded_files)}个文件上传成功，请确认后开始压缩'
                 }), 200
                 
+            except RequestEntityTooLarge:
+                # 交给413错误处理返回明确的提示
+                raise
             except Exception as e:
                 self.logger.error(f"批量上传文件错误: {str(e)}")
                 return jsonify({'error': f'批量上传失败: {str(e)}'}), 500
@@ -327,56 +579,48 @@ class WebServer:
         @self.app.route('/api/task/<task_id>', methods=['GET'])
         def get_task_status(task_id):
             """获取任务状态（包含下载令牌和预览令牌）"""
-            if task_id not in self.tasks:
+            task = self._get_task(task_id)
+            if task is None:
                 return jsonify({'error': '任务不存在'}), 404
             
-            task = self.tasks[task_id].copy()
-            
-            # 为单文件任务生成预览令牌（上传状态）
-            if 'upload_path' in task and task.get('status') == 'uploaded':
-                if task.get('file_ext', '').lower() in ALLOWED_IMAGE_EXTENSIONS:
-                    preview_token = self._generate_download_token(task_id, 'preview_uploaded')
-                    task['preview_token'] = preview_token
-                    task['preview_uploaded_url'] = f"/api/preview-uploaded/{task_id}/0?token={preview_token}"
-            
-            # 为单文件任务生成下载令牌和预览令牌（完成状态）
-            if 'output_filename' in task:
-                filename = task.get('filename', '')
-                task['download_token'] = self._generate_download_token(task_id, filename)
-                task['download_url'] = f"/api/download/{task_id}/{filename}?token={task['download_token']}"
-                
-                # 生成预览令牌（如果是图片）
-                if task.get('file_ext', '').lower() in ALLOWED_IMAGE_EXTENSIONS:
-                    preview_token = self._generate_download_token(task_id, 'preview')
-                    task['preview_token'] = preview_token
-                    task['preview_original_url'] = f"/api/preview/{task_id}/original?token={preview_token}"
-                    task['preview_compressed_url'] = f"/api/preview/{task_id}/compressed?token={preview_token}"
+            return jsonify(self._task_status(task_id, task))
+        
+        @self.app.route('/api/task/<task_id>/wait', methods=['GET'])
+        def wait_task_status(task_id):
+            """长轮询任务状态：任务的rev大于请求中的rev时立即返回，否则最多等待30秒"""
+            rev = request.args.get('rev', -1, type=int)
+            task = self._wait_task(task_id, rev, TASK_WAIT_TIMEOUT)
+            if task is None:
+                return jsonify({'error': '任务不存在'}), 404
+            return jsonify(self._task_status(task_id, task))
+        
+        @self.app.route('/api/task/<task_id>/stream', methods=['GET'])
+        def stream_task_status(task_id):
+            """以SSE推送任务状态，每次状态变化推送一条，任务结束后关闭连接"""
+            if self._get_task(task_id) is None:
+                return jsonify({'error': '任务不存在'}), 404
             
-            # 为批量任务生成预览和下载令牌
-            if 'files' in task:
-                for idx, file_info in enumerate(task['files']):
-                    # 上传状态：生成上传文件预览令牌
-                    if file_info.get('status') == 'uploaded':
-                        if file_info.get('file_ext', '').lower() in ALLOWED_IMAGE_EXTENSIONS:
-                            preview_token = self._generate_download_token(task_id, f'preview_{idx}')
-                            file_info['preview_token'] = preview_token
-                            file_info['preview_uploaded_url'] = f"/api/preview-uploaded/{task_id}/{idx}?token={preview_token}"
-                    
-                    # 完成状态：生成下载令牌和对比预览令牌
-                    if file_info.get('status') == 'completed':
-                        filename = file_info.get('original_filename', '')
-                        file_info['download_token'] = self._generate_download_token(task_id, filename)
-                        file_info['download_url'] = f"/api/download/{task_id}/{filename}?token={file_info['download_token']}"
-                        
-                        # 生成对比预览令牌（如果是图片或视频）
-                        file_ext_lower = file_info.get('file_ext', '').lower()
-                        if file_ext_lower in ALLOWED_IMAGE_EXTENSIONS or file_ext_lower in ALLOWED_VIDEO_EXTENSIONS:
-                            preview_token = self._generate_download_token(task_id, f'preview_compressed_{idx}')
-                            file_info['preview_token'] = preview_token
-                            file_info['preview_original_url'] = f"/api/preview-compressed/{task_id}/{idx}?type=original&token={preview_token}"
-                            file_info['preview_compressed_url'] = f"/api/preview-compressed/{task_id}/{idx}?type=compressed&token={preview_token}"
+            def generate():
+                rev = -1
+                while True:
+                    task = self._wait_task(task_id, rev, TASK_WAIT_TIMEOUT)
+                    if task is None:
+                        return
+                    if task.get('rev', 0) == rev:
+                        # 超时没有变化，发送注释行保持连接
+                        yield ': keepalive\n\n'
+                        continue
+                    rev = task.get('rev', 0)
+                    status = self._task_status(task_id, task)
+                    yield f"data: {json.dumps(status)}\n\n"
+                    if status.get('status') in ('completed', 'failed', 'partial'):
+                        return
             
-            return jsonify(task)
+            return Response(
+                stream_with_context(generate()),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
         
         @self.app.route('/api/download/<task_id>/<filename>', methods=['GET'])
         def download_file(task_id, filename):
@@ -389,8 +633,6 @@ class WebServer:
                 
                 # 验证时间码有效性（5分钟内有效）
                 try:
-                    import hashlib
-                    import hmac
                     expected_token = self._generate_download_token(task_id, filename)
                     if not hmac.compare_digest(token, expected_token):
                         return jsonify({'error': '无效的访问令牌'}), 403
@@ -399,44 +641,64 @@ class WebServer:
                     return jsonify({'error': '令牌验证失败'}), 403
                 
                 # 查找任务中的文件
-                if task_id not in self.tasks:
+                task = self._get_task(task_id)
+                if task is None:
                     return jsonify({'error': '任务不存在'}), 404
                 
-                task = self.tasks[task_id]
                 file_info = None
+                file_index = None
                 
                 # 单文件任务结构（直接在task中）
                 if 'output_path' in task:
                     if task.get('filename') == filename or task.get('output_filename') == filename:
                         file_info = task
                 else:
-                    # 批量任务结构（在files列表中）
-                    for f in task.get('files', []):
-                        if f.get('original_filename') == filename or f.get('output_filename') == filename:
-                            file_info = f
-                            break
+                    # 批量任务结构（通过文件名索引查找）
+                    file_index = task.get('_fname_index', {}).get(filename)
+                    if file_index is not None:
+                        file_info = task['files'][file_index]
                 
                 if not file_info:
                     return jsonify({'error': '文件不存在'}), 404
                 
                 file_path = file_info.get('output_path')
-                if not file_path or not os.path.exists(file_path):
+                st = self._file_stat(file_info, 'output_path')
+                if st is None:
                     return jsonify({'error': '文件路径不存在'}), 404
                 
-                # 发送文件
-                response = send_file(
-                    file_path,
-                    as_attachment=True,
-                    download_name=file_info.get('output_filename', filename)
-                )
+                # 发送文件（nginx模式下只返回X-Accel-Redirect头，由nginx发送文件内容）
+                download_name = file_info.get('output_filename', filename)
+                if self.use_x_accel:
+                    response = make_response('')
+                    response.headers['X-Accel-Redirect'] = X_ACCEL_PREFIX + quote(os.path.basename(file_path))
+                    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+                    response.headers['Cache-Control'] = 'no-cache'
+                else:
+                    # 与预览相同：只发送输出目录中的文件，支持断点续传（Range/If-Range）
+                    try:
+                        response = send_from_directory(
+                            self.output_dir,
+                            os.path.basename(file_path),
+                            as_attachment=True,
+                            download_name=download_name,
+                            conditional=True,
+                            etag=f"{int(st.st_mtime)}-{st.st_size}",
+                            last_modified=st.st_mtime,
+                            max_age=0
+                        )
+                    except NotFound:
+                        return jsonify({'error': '文件路径不存在'}), 404
                 
                 # 标记为已下载，准备删除（延迟删除，给下载时间）
                 # 注意：实际删除应该在客户端确认下载完成后触发
                 # 这里先标记，延迟删除
                 if 'download_marked' not in file_info:
-                    file_info['download_marked'] = True
+                    if file_index is None:
+                        self._update_task(task_id, download_marked=True)
+                    else:
+                        self._update_file(task_id, file_index, download_marked=True)
                     # 延迟删除（60秒后，给足够时间下载）
-                    threading.Timer(60.0, self._delete_file_after_download, args=(file_path,)).start()
+                    self._reaper.schedule(file_path, 60.0)
                 
                 return response
                 
@@ -448,42 +710,32 @@ class WebServer:
         def download_all(task_id):
             """下载所有压缩后的文件（ZIP）"""
             try:
-                if task_id not in self.tasks:
+                task = self._get_task(task_id)
+                if task is None:
                     return jsonify({'error': '任务不存在'}), 404
                 
-                task = self.tasks[task_id]
                 files = task.get('files', [])
                 if not files:
                     return jsonify({'error': '没有可下载的文件'}), 404
                 
-                # 创建ZIP文件
-                import zipfile
+                entries = []
+                for file_info in files:
+                    output_path = file_info.get('output_path')
+                    if output_path and os.path.exists(output_path):
+                        entries.append((
+                            output_path,
+                            file_info.get('output_filename', os.path.basename(output_path))
+                        ))
+                
+                # 边打包边发送，不在磁盘上生成ZIP文件
+                # 图片和视频已经是压缩格式，使用ZIP_STORED避免无效的二次压缩
                 zip_filename = f"compressed_{task_id}.zip"
-                zip_path = os.path.join(self.output_dir, zip_filename)
-                
-                with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                    for file_info in files:
-                        output_path = file_info.get('output_path')
-                        if output_path and os.path.exists(output_path):
-                            zipf.write(
-                                output_path,
-                                file_info.get('output_filename', os.path.basename(output_path))
-                            )
-                
-                response = send_file(
-                    zip_path,
-                    as_attachment=True,
-                    download_name=zip_filename
+                return Response(
+                    stream_with_context(self._generate_zip(entries)),
+                    mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename={zip_filename}'}
                 )
                 
-                # 标记为已下载，准备删除（延迟删除）
-                if 'download_marked' not in task:
-                    task['download_marked'] = True
-                    # 延迟删除ZIP文件（60秒后）
-                    threading.Timer(60.0, self._delete_file_after_download, args=(zip_path,)).start()
-                
-                return response
-                
             except Exception as e:
                 self.logger.error(f"下载ZIP错误: {str(e)}")
                 return jsonify({'error': f'下载失败: {str(e)}'}), 500
@@ -502,11 +754,10 @@ class WebServer:
         def start_compress(task_id):
             """确认并开始压缩"""
             try:
-                if task_id not in self.tasks:
+                task = self._get_task(task_id)
+                if task is None:
                     return jsonify({'error': '任务不存在'}), 404
                 
-                task = self.tasks[task_id]
-                
                 if task.get('status') != 'uploaded':
                     return jsonify({'error': '任务状态不正确，无法开始压缩'}), 400
                 
@@ -515,18 +766,8 @@ class WebServer:
                     settings = request.get_json().get('settings')
                     if settings:
                         try:
-                            # 应用设置（不包含GPU配置）
-                            allowed_keys = {
-                                'photo_quality', 'video_crf', 'video_preset',
-                                'max_photo_width', 'max_photo_height', 'resolution_preset'
-                            }
-                            for key, value in settings.items():
-                                if key in allowed_keys and key in self.config_manager.defaults:
-                                    self.config_manager.set(key, value)
-                            self.config_manager.save()
-                            # 更新压缩器
-                            self.image_compressor = ImageCompressor(self.config_manager, self.logger)
-                            self.video_compressor = VideoCompressor(self.config_manager, self.logger)
+                            # 压缩需要使用新设置，等待设置线程应用完成
+                            self._queue_settings(settings, wait=True)
                         except Exception as e:
                             self.logger.warning(f"应用设置失败: {e}")
                 
@@ -536,13 +777,16 @@ class WebServer:
                     filename = task['filename']
                     file_ext = task['file_ext']
                     
-                    # 在后台线程中处理压缩
-                    thread = threading.Thread(
-                        target=self._compress_single_file,
-                        args=(task_id, upload_path, filename, file_ext)
+                    # 提交到压缩线程池（先标记为处理中，避免重复提交）
+                    if not self._claim_task(task_id):
+                        return jsonify({'error': '任务状态不正确，无法开始压缩'}), 400
+                    future = self.executor.submit(
+                        self._compress_single_file, task_id, upload_path, filename, file_ext,
+                        task.get('_content_hash'), task.get('upload_size')
                     )
-                    thread.daemon = True
-                    thread.start()
+                    # 线程意外退出时也要唤醒等待状态变化的请求
+                    future.add_done_callback(lambda _future: self._update_task(task_id))
+                    self._update_task(task_id, future=future)
                     
                     return jsonify({
                         'message': '压缩已开始',
@@ -552,26 +796,34 @@ class WebServer:
                 # 批量压缩
                 elif 'files' in task:
                     upload_files = []
-                    for file_info in task['files']:
+                    for idx, file_info in enumerate(task['files']):
                         if file_info.get('status') == 'uploaded':
                             upload_files.append((
+                                idx,
                                 file_info['upload_path'],
                                 file_info['original_filename'],
-                                file_info['file_ext']
+                                file_info['file_ext'],
+                                file_info.get('_content_hash'),
+                                file_info.get('upload_size')
                             ))
                     
                     if not upload_files:
                         return jsonify({'error': '没有可压缩的文件'}), 400
                     
                     # 更新任务状态
-                    task['status'] = 'processing'
-                    task['completed'] = 0
-                    task['failed'] = 0
+                    if not self._claim_task(task_id):
+                        return jsonify({'error': '任务状态不正确，无法开始压缩'}), 400
+                    self._update_task(task_id, completed=0, failed=0)
                     
-                    # 在后台线程中处理批量压缩
+                    # 每个文件单独提交到压缩线程池，由后台线程汇总结果
+                    futures = {
+                        self.executor.submit(self._compress_batch_file, task_id, *file_args): file_args
+                        for file_args in upload_files
+                    }
+                    self._update_task(task_id, futures=list(futures))
                     thread = threading.Thread(
                         target=self._compress_batch_files,
-                        args=(task_id, upload_files)
+                        args=(task_id, futures)
                     )
                     thread.daemon = True
                     thread.start()
@@ -599,8 +851,6 @@ class WebServer:
                 
                 # 验证时间码有效性
                 try:
-                    import hashlib
-                    import hmac
                     expected_token = self._generate_download_token(task_id, f'preview_{file_index}')
                     if not hmac.compare_digest(token, expected_token):
                         return jsonify({'error': '无效的访问令牌'}), 403
@@ -608,25 +858,13 @@ class WebServer:
                     self.logger.warning(f"预览令牌验证失败: {e}")
                     return jsonify({'error': '令牌验证失败'}), 403
                 
-                if task_id not in self.tasks:
+                task = self._get_task(task_id)
+                if task is None:
                     return jsonify({'error': '任务不存在'}), 404
                 
-                task = self.tasks[task_id]
-                
                 # 单文件模式
                 if 'upload_path' in task:
-                    file_path = task.get('upload_path')
-                    if not file_path or not os.path.exists(file_path):
-                        return jsonify({'error': '文件不存在'}), 404
-                    
-                    file_ext = os.path.splitext(file_path)[1].lower()
-                    if file_ext not in ALLOWED_IMAGE_EXTENSIONS:
-                        return jsonify({'error': '只支持图片预览'}), 400
-                    
-                    response = send_file(file_path, mimetype=f'image/{file_ext[1:]}')
-                    response.headers['Cache-Control'] = 'public, max-age=31536000'
-                    response.headers['ETag'] = str(int(os.path.getmtime(file_path)))
-                    return response
+                    return self._serve_preview(task, 'upload_path', images_only=True)
                 
                 # 批量模式
                 elif 'files' in task:
@@ -636,20 +874,7 @@ class WebServer:
                         if file_index_int < 0 or file_index_int >= len(files):
                             return jsonify({'error': '文件索引无效'}), 400
                         
-                        file_info = files[file_index_int]
-                        file_path = file_info.get('upload_path')
-                        
-                        if not file_path or not os.path.exists(file_path):
-                            return jsonify({'error': '文件不存在'}), 404
-                        
-                        file_ext = os.path.splitext(file_path)[1].lower()
-                        if file_ext not in ALLOWED_IMAGE_EXTENSIONS:
-                            return jsonify({'error': '只支持图片预览'}), 400
-                        
-                        response = send_file(file_path, mimetype=f'image/{file_ext[1:]}')
-                        response.headers['Cache-Control'] = 'public, max-age=31536000'
-                        response.headers['ETag'] = str(int(os.path.getmtime(file_path)))
-                        return response
+                        return self._serve_preview(files[file_index_int], 'upload_path', images_only=True)
                     except ValueError:
                         return jsonify({'error': '无效的文件索引'}), 400
                 
@@ -672,8 +897,6 @@ class WebServer:
                 
                 # 验证时间码有效性
                 try:
-                    import hashlib
-                    import hmac
                     expected_token = self._generate_download_token(task_id, f'preview_compressed_{file_index}')
                     if not hmac.compare_digest(token, expected_token):
                         return jsonify({'error': '无效的访问令牌'}), 403
@@ -681,11 +904,10 @@ class WebServer:
                     self.logger.warning(f"预览令牌验证失败: {e}")
                     return jsonify({'error': '令牌验证失败'}), 403
                 
-                if task_id not in self.tasks:
+                task = self._get_task(task_id)
+                if task is None:
                     return jsonify({'error': '任务不存在'}), 404
                 
-                task = self.tasks[task_id]
-                
                 # 批量模式
                 if 'files' in task:
                     try:
@@ -694,41 +916,8 @@ class WebServer:
                         if file_index_int < 0 or file_index_int >= len(files):
                             return jsonify({'error': '文件索引无效'}), 400
                         
-                        file_info = files[file_index_int]
-                        
-                        if file_type == 'original':
-                            file_path = file_info.get('upload_path')
-                        else:  # compressed
-                            file_path = file_info.get('output_path')
-                        
-                        if not file_path or not os.path.exists(file_path):
-                            return jsonify({'error': '文件不存在'}), 404
-                        
-                        file_ext = os.path.splitext(file_path)[1].lower()
-                        if file_ext not in ALLOWED_IMAGE_EXTENSIONS and file_ext not in ALLOWED_VIDEO_EXTENSIONS:
-                            return jsonify({'error': '只支持图片和视频预览'}), 400
-                        
-                        # 根据文件类型设置MIME类型
-                        if file_ext in ALLOWED_IMAGE_EXTENSIONS:
-                            mimetype = f'image/{file_ext[1:]}'
-                        else:  # 视频
-                            mimetype_map = {
-                                '.mp4': 'video/mp4',
-                                '.avi': 'video/x-msvideo',
-                                '.mov': 'video/quicktime',
-                                '.mkv': 'video/x-matroska',
-                                '.wmv': 'video/x-ms-wmv',
-                                '.flv': 'video/x-flv',
-                                '.m4v': 'video/mp4',
-                                '.webm': 'video/webm',
-                                '.3gp': 'video/3gpp'
-                            }
-                            mimetype = mimetype_map.get(file_ext, 'video/mp4')
-                        
-                        response = send_file(file_path, mimetype=mimetype)
-                        response.headers['Cache-Control'] = 'public, max-age=31536000'
-                        response.headers['ETag'] = str(int(os.path.getmtime(file_path)))
-                        return response
+                        path_key = 'upload_path' if file_type == 'original' else 'output_path'
+                        return self._serve_preview(files[file_index_int], path_key)
                     except ValueError:
                         return jsonify({'error': '无效的文件索引'}), 400
                 
@@ -740,19 +929,21 @@ class WebServer:
         
         @self.app.route('/api/config/presets', methods=['GET'])
         def get_presets():
-            """获取所有预设配置"""
-            presets = {}
-            for key, value in self.PRESET_CONFIGS.items():
-                presets[key] = {
-                    'name': value['name'],
-                    'photo_quality': value['photo_quality'],
-                    'video_crf': value['video_crf'],
-                    'resolution': value['resolution_preset']
+            """获取所有预设配置（预设不变，响应体按当前预设缓存）"""
+            def build():
+                presets = {}
+                for key, value in self.PRESET_CONFIGS.items():
+                    presets[key] = {
+                        'name': value['name'],
+                        'photo_quality': value['photo_quality'],
+                        'video_crf': value['video_crf'],
+                        'resolution': value['resolution_preset']
+                    }
+                return {
+                    'presets': presets,
+                    'current': self.current_preset
                 }
-            return jsonify({
-                'presets': presets,
-                'current': self.current_preset
-            })
+            return self._cached_json_response(('presets', self.current_preset), build)
         
         @self.app.route('/api/config/preset/<preset_id>', methods=['POST'])
         def set_preset(preset_id):
@@ -772,9 +963,8 @@ class WebServer:
             # 保存配置
             self.config_manager.save()
             
-            # 更新压缩器
-            self.image_compressor = ImageCompressor(self.config_manager, self.logger)
-            self.video_compressor = VideoCompressor(self.config_manager, self.logger)
+            # 更新压缩器（图片压缩器每次压缩时读取配置，无需处理）
+            self.video_compressor.reload_config()
             
             self.current_preset = preset_id
             self.logger.info(f"Web配置已切换到预设: {preset['name']}（GPU配置保持不变）")
@@ -803,23 +993,16 @@ class WebServer:
             try:
                 data = request.get_json()
                 
-                # 允许更新的配置项（排除GPU相关配置）
-                allowed_keys = {
-                    'photo_quality', 'video_crf', 'video_preset',
-                    'max_photo_width', 'max_photo_height', 'resolution_preset'
-                }
-                
-                # 更新配置
+                # 更新配置（排除GPU相关配置）
                 for key, value in data.items():
-                    if key in allowed_keys and key in self.config_manager.defaults:
+                    if key in ALLOWED_SETTING_KEYS:
                         self.config_manager.set(key, value)
                 
                 # 保存配置
                 self.config_manager.save()
                 
-                # 更新压缩器
-                self.image_compressor = ImageCompressor(self.config_manager, self.logger)
-                self.video_compressor = VideoCompressor(self.config_manager, self.logger)
+                # 更新压缩器（图片压缩器每次压缩时读取配置，无需处理）
+                self.video_compressor.reload_config()
                 
                 self.current_preset = 'custom'  # 标记为自定义配置
                 self.logger.info("Web高级配置已更新（GPU配置保持不变）")
@@ -831,9 +1014,9 @@ class WebServer:
         
         @self.app.route('/api/config/gpu-status', methods=['GET'])
         def get_gpu_status():
-            """获取GPU状态（只读）"""
+            """获取GPU状态（只读，响应体按GPU类型缓存）"""
             current_gpu = self.config_manager.get('use_gpu', 'cpu')
-            return jsonify({
+            return self._cached_json_response(('gpu-status', current_gpu), lambda: {
                 'gpu_type': current_gpu,
                 'gpu_name': self._get_gpu_name(current_gpu),
                 'auto_detected': True,
@@ -851,8 +1034,6 @@ class WebServer:
                 
                 # 验证时间码有效性
                 try:
-                    import hashlib
-                    import hmac
                     expected_token = self._generate_download_token(task_id, 'preview')
                     if not hmac.compare_digest(token, expected_token):
                         return jsonify({'error': '无效的访问令牌'}), 403
@@ -860,182 +1041,688 @@ class WebServer:
                     self.logger.warning(f"预览令牌验证失败: {e}")
                     return jsonify({'error': '令牌验证失败'}), 403
                 
-                if task_id not in self.tasks:
+                task = self._get_task(task_id)
+                if task is None:
                     return jsonify({'error': '任务不存在'}), 404
                 
-                task = self.tasks[task_id]
-                file_path = None
-                
                 # 根据文件类型返回对应的文件
                 if file_type == 'original':
-                    file_path = task.get('upload_path')
+                    return self._serve_preview(task, 'upload_path', images_only=True)
                 elif file_type == 'compressed':
-                    file_path = task.get('output_path')
-                else:
-                    return jsonify({'error': '无效的文件类型'}), 400
-                
-                if not file_path or not os.path.exists(file_path):
-                    return jsonify({'error': '文件不存在'}), 404
-                
-                # 只支持图片预览
-                file_ext = os.path.splitext(file_path)[1].lower()
-                if file_ext not in ALLOWED_IMAGE_EXTENSIONS:
-                    return jsonify({'error': '只支持图片预览'}), 400
-                
-                # 发送文件（不强制下载，用于预览）
-                # 设置缓存头，利用浏览器缓存
-                response = send_file(file_path, mimetype=f'image/{file_ext[1:]}')
-                response.headers['Cache-Control'] = 'public, max-age=31536000'  # 1年缓存
-                response.headers['ETag'] = str(int(os.path.getmtime(file_path)))
-                return response
+                    return self._serve_preview(task, 'output_path', images_only=True)
+                return jsonify({'error': '无效的文件类型'}), 400
                 
             except Exception as e:
                 self.logger.error(f"预览文件错误: {str(e)}")
                 return jsonify({'error': f'预览失败: {str(e)}'}), 500
     
-    def _compress_single_file(self, task_id, upload_path, filename, file_ext):
-        """压缩单个文件"""
+    def _queue_settings(self, settings, wait=False):
+        """
+        提交前端设置（由设置线程应用并保存）
+        
+        Args:
+            settings: 设置字典
+            wait: 是否等待设置应用到压缩器
+        """
+        applied = threading.Event()
+        self._settings_queue.put((settings, applied))
+        if wait and not applied.wait(SETTINGS_APPLY_TIMEOUT):
+            self.logger.warning("等待设置生效超时，使用当前设置压缩")
+    
+    def _cached_json_response(self, key, build):
+        """
+        返回缓存的JSON响应，同一key只在第一次请求时序列化
+        
+        Args:
+            key: 缓存键（包含决定响应内容的全部状态）
+            build: 生成响应数据的函数
+            
+        Returns:
+            Flask响应对象
+        """
+        body = self._json_cache.get(key)
+        if body is None:
+            body = json.dumps(build()).encode('utf-8')
+            self._json_cache[key] = body
+        return Response(body, mimetype='application/json')
+    
+    def _apply_settings(self, settings):
+        """
+        应用设置（不包含GPU配置），设置有变化时重建压缩器
+        
+        Returns:
+            True如果有设置发生变化
+        """
+        changed = False
+        for key, value in settings.items():
+            if key in ALLOWED_SETTING_KEYS and self.config_manager.get(key) != value:
+                self.config_manager.set(key, value)
+                changed = True
+        if changed:
+            # 更新压缩器（图片压缩器每次压缩时读取配置，无需处理）
+            self.video_compressor.reload_config()
+        return changed
+    
+    def _settings_worker(self):
+        """设置线程：依次应用队列中的设置，合并短时间内的多次修改后只写一次配置文件"""
+        while True:
+            pending = [self._settings_queue.get()]
+            deadline = time.monotonic() + SETTINGS_SAVE_DEBOUNCE
+            dirty = False
+            
+            while pending:
+                settings, applied = pending.pop()
+                try:
+                    dirty = self._apply_settings(settings) or dirty
+                except Exception as e:
+                    self.logger.warning(f"应用设置失败: {e}")
+                finally:
+                    applied.set()
+                
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    try:
+                        pending.append(self._settings_queue.get(timeout=remaining))
+                    except queue.Empty:
+                        pass
+            
+            # 设置未变化时不重写配置文件
+            if dirty:
+                try:
+                    self.config_manager.save()
+                except Exception as e:
+                    self.logger.warning(f"保存设置失败: {e}")
+    
+    def _save_upload(self, file_storage, upload_path):
+        """
+        保存上传的文件（使用大缓冲区复制，减少大视频文件的写入次数）
+        
+        Args:
+            file_storage: 上传的文件对象
+            upload_path: 保存路径
+            
+        Returns:
+            (文件内容的哈希值, 文件大小)，都在复制时顺带计算，哈希值用于识别重复上传
+        """
+        hasher = hashlib.blake2b(digest_size=16)
+        size = 0
+        with open(upload_path, 'wb', buffering=0) as f:
+            # 压缩器随后会顺序读取该文件，提示内核加大预读
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            while True:
+                chunk = file_storage.stream.read(UPLOAD_COPY_BUFFER)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        return hasher.hexdigest(), size
+    
+    def _compress_file(self, upload_path, output_path, file_ext, content_hash=None):
+        """
+        压缩文件，相同内容和设置的文件已压缩过时直接复用之前的结果
+        
+        Args:
+            upload_path: 上传文件路径
+            output_path: 输出文件路径
+            file_ext: 文件扩展名
+            content_hash: 上传文件内容的哈希值
+            
+        Returns:
+            True如果成功
+        """
+        dedup_key = None
+        if content_hash:
+            settings = tuple(self.config_manager.get(key) for key in sorted(ALLOWED_SETTING_KEYS))
+            dedup_key = (content_hash, file_ext, settings)
+            with self._tasks_lock:
+                cached = self._dedup.get(dedup_key)
+            if cached:
+                cached_path, identity = cached
+                # 输出文件可能已被同名上传覆盖或被删除后重建，文件标识不一致时不能复用
+                if self._file_identity(cached_path) == identity:
+                    # 每个任务的输出路径都不同，复用时总是链接出一份，各任务删除自己的文件时互不影响
+                    self._link_output(cached_path, output_path)
+                    self.logger.info(f"文件已压缩过，复用结果: {cached_path} -> {output_path}")
+                    return True
+                with self._tasks_lock:
+                    if self._dedup.get(dedup_key) == cached:
+                        del self._dedup[dedup_key]
+        
+        # 先删除残留的旧输出文件（例如上次运行留下的同序号文件），
+        # 压缩器写入新文件，不会原地改写与其他任务硬链接共享的内容
         try:
-            self.tasks[task_id] = {
-                'status': 'processing',
-                'filename': filename,
-                'upload_path': upload_path,  # 保存上传路径用于预览
-                'file_ext': file_ext,
-                'progress': 0
-            }
+            os.remove(output_path)
+        except FileNotFoundError:
+            pass
+        
+        kind = EXT_KIND.get(file_ext)
+        success = False
+        if kind == 'image':
+            success = self.image_compressor.compress(upload_path, output_path)
+        elif kind == 'video':
+            if self.config_manager.get('use_gpu', 'cpu') != 'cpu':
+                with self._gpu_slots:
+                    success = self.video_compressor.compress(upload_path, output_path)
+            else:
+                success = self.video_compressor.compress(upload_path, output_path)
+        
+        if success and dedup_key:
+            identity = self._file_identity(output_path)
+            if identity is not None:
+                with self._tasks_lock:
+                    self._dedup[dedup_key] = (output_path, identity)
+        return success
+    
+    @classmethod
+    def _file_identity(cls, file_path):
+        """
+        获取文件标识（inode、修改时间、大小），用于判断文件是否仍是记录时的那个文件
+        
+        Returns:
+            (st_ino, st_mtime_ns, st_size)，文件不存在时返回None
+        """
+        st = cls._stat_or_none(file_path)
+        if st is None:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+    
+    @staticmethod
+    def _link_output(source_path, output_path):
+        """
+        复用已有的输出文件（优先使用硬链接，各任务删除自己的文件时互不影响）
+        """
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        try:
+            os.link(source_path, output_path)
+        except OSError:
+            shutil.copyfile(source_path, output_path)
+    
+    def _generate_zip(self, entries):
+        """
+        逐块生成ZIP文件内容
+        
+        Args:
+            entries: (文件路径, ZIP中的文件名) 列表
+            
+        Yields:
+            ZIP数据块
+        """
+        buffer = _ZipStreamBuffer()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zipf:
+            for file_path, arcname in entries:
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+                with open(file_path, 'rb') as src, zipf.open(zinfo, 'w') as dst:
+                    while True:
+                        chunk = src.read(ZIP_STREAM_CHUNK)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                        yield buffer.pop()
+                yield buffer.pop()
+        yield buffer.pop()
+    
+    @staticmethod
+    def _stat_or_none(file_path):
+        """获取文件的stat结果，路径为空或文件不存在时返回None（一次系统调用同时完成存在性检查）"""
+        if not file_path:
+            return None
+        try:
+            return os.stat(file_path)
+        except FileNotFoundError:
+            return None
+    
+    def _file_stat(self, info, path_key):
+        """
+        获取任务中文件的stat结果（优先使用压缩完成时记录的结果，重复预览时不再访问文件系统）
+        
+        Args:
+            info: 任务信息或批量任务中的文件信息字典
+            path_key: 路径字段名（'upload_path'或'output_path'）
+            
+        Returns:
+            os.stat结果，路径为空或文件不存在时返回None
+        """
+        file_path = info.get(path_key)
+        if not file_path:
+            return None
+        return info.get(f'_{path_key}_stat') or self._stat_or_none(file_path)
+    
+    def _serve_preview(self, info, path_key, images_only=False):
+        """
+        预览任务中的文件（各预览路由共用：检查文件、判断类型后发送）
+        
+        Args:
+            info: 任务信息或批量任务中的文件信息字典
+            path_key: 路径字段名（'upload_path'或'output_path'）
+            images_only: 是否只允许预览图片
+            
+        Returns:
+            Flask响应
+        """
+        file_path = info.get(path_key)
+        if not file_path and path_key == 'upload_path' and path_key in info:
+            return jsonify({'error': '上传文件已在压缩后删除'}), 410
+        
+        st = self._file_stat(info, path_key)
+        if st is None:
+            return jsonify({'error': '文件不存在'}), 404
+        
+        kind, mimetype = _classify(file_path)
+        if images_only and kind != 'image':
+            return jsonify({'error': '只支持图片预览'}), 400
+        if mimetype is None:
+            return jsonify({'error': '只支持图片和视频预览'}), 400
+        
+        # 发送文件（不强制下载，用于预览）
+        return self._send_preview(file_path, mimetype, st)
+    
+    def _send_preview(self, file_path, mimetype, st=None):
+        """
+        发送预览文件（带ETag和Last-Modified，浏览器重复请求时直接返回304）
+        
+        只发送上传目录和输出目录中的文件，由send_from_directory交给WSGI服务器的file_wrapper发送；
+        nginx模式下只返回X-Accel-Redirect头，由nginx用sendfile发送（范围请求也由nginx处理）。
+        
+        Args:
+            file_path: 文件路径
+            mimetype: MIME类型
+            st: 调用方已获取的os.stat结果（不提供时重新获取）
+            
+        Returns:
+            Flask响应对象
+        """
+        directory, filename = os.path.split(os.path.abspath(file_path))
+        if directory == os.path.abspath(self.output_dir):
+            accel_prefix = X_ACCEL_PREFIX
+        elif directory == os.path.abspath(self.upload_dir):
+            accel_prefix = X_ACCEL_UPLOAD_PREFIX
+        else:
+            return jsonify({'error': '无权访问该文件'}), 403
+        
+        if st is None:
+            st = os.stat(file_path)
+        mtime = st.st_mtime
+        etag = f"{int(mtime)}-{st.st_size}"
+        
+        # 浏览器缓存仍然有效（If-None-Match/If-Modified-Since匹配）时直接返回304，不打开文件
+        last_modified = datetime.fromtimestamp(mtime, timezone.utc)
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.cache_control.public = True
+            response.cache_control.max_age = 31536000
+            return response
+        
+        if self.use_x_accel:
+            response = make_response('')
+            response.headers['X-Accel-Redirect'] = accel_prefix + quote(filename)
+            response.headers['Content-Type'] = mimetype
+            response.headers['Cache-Control'] = 'public, max-age=31536000'
+            return response
+        
+        try:
+            return send_from_directory(
+                directory,
+                filename,
+                mimetype=mimetype,
+                conditional=True,
+                etag=etag,
+                last_modified=mtime,
+                max_age=31536000  # 1年缓存
+            )
+        except NotFound:
+            # 记录stat结果之后文件已被删除（例如下载后的延迟删除）
+            return jsonify({'error': '文件不存在'}), 404
+    
+    def _task_status(self, task_id, task):
+        """
+        把任务信息副本整理成状态接口返回的内容（去掉内部字段，加入下载令牌和预览令牌）
+        
+        Args:
+            task_id: 任务ID
+            task: _get_task返回的任务信息副本（会被直接修改）
+            
+        Returns:
+            可序列化的任务状态字典
+        """
+        # Future对象不能序列化，只用于判断任务是否异常结束
+        future = task.pop('future', None)
+        task.pop('futures', None)
+        # 下划线开头的字段只在服务器内部使用（文件名索引、缓存的stat结果等）
+        for key in [key for key in task if key.startswith('_')]:
+            del task[key]
+        if future is not None and future.done() and future.exception() is not None \
+                and task.get('status') == 'processing':
+            task['status'] = 'failed'
+            task['error'] = str(future.exception())
+        
+        # 为单文件任务生成预览令牌（上传状态）
+        if 'upload_path' in task and task.get('status') == 'uploaded':
+            if EXT_KIND.get(task.get('file_ext', '').lower()) == 'image':
+                preview_token = self._generate_download_token(task_id, 'preview_uploaded')
+                task['preview_token'] = preview_token
+                task['preview_uploaded_url'] = f"/api/preview-uploaded/{task_id}/0?token={preview_token}"
+        
+        # 为单文件任务生成下载令牌和预览令牌（完成状态）
+        if 'output_filename' in task:
+            filename = task.get('filename', '')
+            task['download_token'] = self._generate_download_token(task_id, filename)
+            task['download_url'] = f"/api/download/{task_id}/{filename}?token={task['download_token']}"
+            
+            # 生成预览令牌（如果是图片）
+            if EXT_KIND.get(task.get('file_ext', '').lower()) == 'image':
+                preview_token = self._generate_download_token(task_id, 'preview')
+                task['preview_token'] = preview_token
+                # 上传文件在压缩后删除，只有仍保留时才提供原始文件预览链接
+                if task.get('upload_path'):
+                    task['preview_original_url'] = f"/api/preview/{task_id}/original?token={preview_token}"
+                task['preview_compressed_url'] = f"/api/preview/{task_id}/compressed?token={preview_token}"
+        
+        # 为批量任务生成预览和下载令牌
+        if 'files' in task:
+            for idx, file_info in enumerate(task['files']):
+                for key in [key for key in file_info if key.startswith('_')]:
+                    del file_info[key]
+                
+                # 上传状态：生成上传文件预览令牌
+                if file_info.get('status') == 'uploaded':
+                    if EXT_KIND.get(file_info.get('file_ext', '').lower()) == 'image':
+                        preview_token = self._generate_download_token(task_id, f'preview_{idx}')
+                        file_info['preview_token'] = preview_token
+                        file_info['preview_uploaded_url'] = f"/api/preview-uploaded/{task_id}/{idx}?token={preview_token}"
+                
+                # 完成状态：生成下载令牌和对比预览令牌
+                if file_info.get('status') == 'completed':
+                    filename = file_info.get('original_filename', '')
+                    file_info['download_token'] = self._generate_download_token(task_id, filename)
+                    file_info['download_url'] = f"/api/download/{task_id}/{filename}?token={file_info['download_token']}"
+                    
+                    # 生成对比预览令牌（如果是图片或视频）
+                    if file_info.get('file_ext', '').lower() in EXT_KIND:
+                        preview_token = self._generate_download_token(task_id, f'preview_compressed_{idx}')
+                        file_info['preview_token'] = preview_token
+                        if file_info.get('upload_path'):
+                            file_info['preview_original_url'] = f"/api/preview-compressed/{task_id}/{idx}?type=original&token={preview_token}"
+                        file_info['preview_compressed_url'] = f"/api/preview-compressed/{task_id}/{idx}?type=compressed&token={preview_token}"
+        
+        return task
+    
+    def _wait_task(self, task_id, rev, timeout):
+        """
+        等待任务状态变化
+        
+        Args:
+            task_id: 任务ID
+            rev: 调用方已知的任务版本号
+            timeout: 最长等待秒数
             
+        Returns:
+            任务信息副本（超时则为当前状态），任务不存在时返回None
+        """
+        with self._tasks_changed:
+            self._tasks_changed.wait_for(
+                lambda: task_id not in self.tasks or self.tasks[task_id]['rev'] != rev,
+                timeout
+            )
+        return self._get_task(task_id)
+    
+    def _touch_task(self, task):
+        """任务状态已变化：版本号加1并唤醒等待的请求（调用方需持有_tasks_lock）"""
+        task['rev'] = task.get('rev', 0) + 1
+        self._tasks_changed.notify_all()
+    
+    def _add_task(self, task_id, task):
+        """登记新任务"""
+        with self._tasks_lock:
+            task['rev'] = 0
+            self.tasks[task_id] = task
+    
+    def _get_task(self, task_id):
+        """
+        获取任务信息的副本（文件列表中的字典同样复制，调用方可随意修改）
+        
+        Args:
+            task_id: 任务ID
+            
+        Returns:
+            任务信息字典，任务不存在时返回None
+        """
+        with self._tasks_lock:
+            task = self.tasks.get(task_id)
+            if task is None:
+                return None
+            task = dict(task)
+            if 'files' in task:
+                task['files'] = [dict(file_info) for file_info in task['files']]
+            return task
+    
+    def _update_task(self, task_id, **fields):
+        """更新任务字段（任务不存在时忽略）"""
+        with self._tasks_lock:
+            task = self.tasks.get(task_id)
+            if task is not None:
+                task.update(fields)
+                self._touch_task(task)
+    
+    def _update_file(self, task_id, idx, **fields):
+        """更新批量任务中第idx个文件的字段（任务不存在时忽略）"""
+        with self._tasks_lock:
+            task = self.tasks.get(task_id)
+            if task is not None:
+                task['files'][idx].update(fields)
+                self._touch_task(task)
+    
+    def _index_file(self, task_id, idx, *filenames):
+        """登记批量任务文件的下载文件名（原始文件名和输出文件名），下载时按文件名直接查找"""
+        with self._tasks_lock:
+            task = self.tasks.get(task_id)
+            if task is not None:
+                fname_index = task.setdefault('_fname_index', {})
+                for filename in filenames:
+                    fname_index.setdefault(filename, idx)
+    
+    def _claim_task(self, task_id):
+        """
+        把已上传的任务标记为处理中（检查和修改在同一个锁内完成，防止重复开始压缩）
+        
+        Returns:
+            True如果任务状态为uploaded并已被标记
+        """
+        with self._tasks_lock:
+            task = self.tasks.get(task_id)
+            if task is None or task.get('status') != 'uploaded':
+                return False
+            task['status'] = 'processing'
+            self._touch_task(task)
+            return True
+    
+    def _output_names(self, filename, upload_path):
+        """
+        生成压缩输出的文件名和完整路径
+        
+        输出路径沿用上传文件名中的序号（{seq}_{filename}或{seq}_{idx}_{filename}），
+        同名上传的多个任务各自写入不同的文件；下载时使用的输出文件名不带序号。
+        
+        Args:
+            filename: 原始文件名（已经过secure_filename处理）
+            upload_path: 上传文件路径
+            
+        Returns:
+            (输出文件名, 输出路径)
+        """
+        return 'compressed_' + filename, self._output_prefix + os.path.basename(upload_path)
+    
+    def _compress_single_file(self, task_id, upload_path, filename, file_ext, content_hash=None,
+                              original_size=None):
+        """压缩单个文件（任务已由_claim_task标记为处理中，这里只更新发生变化的字段）"""
+        try:
             # 确定输出路径
-            output_filename = f"compressed_{filename}"
-            output_path = os.path.join(self.output_dir, output_filename)
+            output_filename, output_path = self._output_names(filename, upload_path)
             
             # 压缩文件
-            success = False
-            if file_ext in ALLOWED_IMAGE_EXTENSIONS:
-                success = self.image_compressor.compress(upload_path, output_path)
-            elif file_ext in ALLOWED_VIDEO_EXTENSIONS:
-                success = self.video_compressor.compress(upload_path, output_path)
+            success = self._compress_file(upload_path, output_path, file_ext, content_hash)
             
-            if success and os.path.exists(output_path):
-                original_size = os.path.getsize(upload_path)
-                compressed_size = os.path.getsize(output_path)
+            # 记录输出文件的stat结果，预览时直接使用
+            output_stat = self._stat_or_none(output_path) if success else None
+            if output_stat is not None:
+                # 上传时已记录文件大小，不再stat上传文件
+                if original_size is None:
+                    original_size = os.path.getsize(upload_path)
+                compressed_size = output_stat.st_size
                 compression_ratio = (1 - compressed_size / original_size) * 100 if original_size > 0 else 0
                 
-                self.tasks[task_id] = {
-                    'status': 'completed',
-                    'filename': filename,
+                self._update_task(
+                    task_id,
+                    status='completed',
+                    output_filename=output_filename,
+                    output_path=output_path,
+                    upload_path=None,  # 上传文件在压缩后删除
+                    original_size=original_size,
+                    compressed_size=compressed_size,
+                    compression_ratio=compression_ratio,
+                    progress=100,
+                    _output_path_stat=output_stat
+                )
+                
+                self.logger.info(f"Web单文件压缩完成: {filename}, 压缩率: {compression_ratio:.2f}%")
+            else:
+                self._update_task(task_id, status='failed', upload_path=None, error='压缩失败')
+                self.logger.error(f"Web单文件压缩失败: {filename}")
+                
+        except Exception as e:
+            self._update_task(task_id, status='failed', upload_path=None, error=str(e))
+            self.logger.error(f"Web单文件压缩错误: {str(e)}")
+        finally:
+            # 压缩已读完源文件，立即删除上传文件释放磁盘空间（成功或失败都删除）
+            self._discard_upload(upload_path)
+    
+    def _compress_batch_file(self, task_id, idx, upload_path, filename, file_ext, content_hash=None,
+                             original_size=None):
+        """
+        压缩批量任务中的单个文件（在压缩线程池中运行）
+        
+        Args:
+            task_id: 任务ID
+            idx: 文件在任务文件列表中的索引
+            upload_path: 上传文件路径
+            filename: 原始文件名
+            file_ext: 文件扩展名
+            content_hash: 上传文件内容的哈希值
+            original_size: 上传时记录的文件大小，为None时重新获取
+            
+        Returns:
+            文件信息字典
+        """
+        self._update_file(task_id, idx, status='processing')
+        
+        try:
+            # 确定输出路径
+            output_filename, output_path = self._output_names(filename, upload_path)
+            
+            # 压缩文件
+            success = self._compress_file(upload_path, output_path, file_ext, content_hash)
+            
+            # 记录输出文件的stat结果，预览时直接使用
+            output_stat = self._stat_or_none(output_path) if success else None
+            if output_stat is not None:
+                # 上传时已记录文件大小，不再stat上传文件
+                if original_size is None:
+                    original_size = os.path.getsize(upload_path)
+                compressed_size = output_stat.st_size
+                compression_ratio = (1 - compressed_size / original_size) * 100 if original_size > 0 else 0
+                
+                return {
+                    'original_filename': filename,
                     'output_filename': output_filename,
                     'output_path': output_path,
-                    'upload_path': upload_path,  # 保存用于预览对比
+                    'upload_path': None,  # 上传文件已在压缩后删除
                     'file_ext': file_ext,
                     'original_size': original_size,
                     'compressed_size': compressed_size,
                     'compression_ratio': compression_ratio,
-                    'progress': 100
-                }
-                
-                self.logger.info(f"Web单文件压缩完成: {filename}, 压缩率: {compression_ratio:.2f}%")
-            else:
-                self.tasks[task_id] = {
-                    'status': 'failed',
-                    'filename': filename,
-                    'error': '压缩失败'
+                    'status': 'completed',
+                    '_output_path_stat': output_stat
                 }
-                self.logger.error(f"Web单文件压缩失败: {filename}")
-                
+            
+            return {
+                'original_filename': filename,
+                'upload_path': None,  # 上传文件已在压缩后删除
+                'file_ext': file_ext,
+                'status': 'failed',
+                'error': '压缩失败'
+            }
+            
         except Exception as e:
-            self.tasks[task_id] = {
+            return {
+                'original_filename': filename,
+                'upload_path': None,  # 上传文件已在压缩后删除
+                'file_ext': file_ext,
                 'status': 'failed',
-                'filename': filename,
                 'error': str(e)
             }
-            self.logger.error(f"Web单文件压缩错误: {str(e)}")
         finally:
-            # 清理上传文件（可选，保留一段时间）
-            pass
+            # 压缩已读完源文件，立即删除上传文件释放磁盘空间（成功或失败都删除）
+            self._discard_upload(upload_path)
     
-    def _compress_batch_files(self, task_id, upload_files):
-        """批量压缩文件"""
+    def _compress_batch_files(self, task_id, futures):
+        """
+        汇总批量压缩结果（按完成顺序更新任务状态）
+        
+        Args:
+            task_id: 任务ID
+            futures: 压缩Future到(索引, 上传路径, 文件名, 扩展名, 内容哈希)的映射
+        """
+        total = len(futures)
+        done = 0
+        completed = 0
+        failed = 0
+        
         try:
-            task = self.tasks[task_id]
-            total = len(upload_files)
-            
-            for idx, (upload_path, filename, file_ext) in enumerate(upload_files):
+            for future in as_completed(futures):
+                idx, upload_path, filename, file_ext = futures[future][:4]
                 try:
-                    # 确定输出路径
-                    output_filename = f"compressed_{filename}"
-                    output_path = os.path.join(self.output_dir, output_filename)
-                    
-                    # 保存上传路径用于后续删除
-                    file_info_base = {
-                        'original_filename': filename,
-                        'upload_path': upload_path,
-                        'file_ext': file_ext
-                    }
-                    
-                    # 压缩文件
-                    success = False
-                    if file_ext in ALLOWED_IMAGE_EXTENSIONS:
-                        success = self.image_compressor.compress(upload_path, output_path)
-                    elif file_ext in ALLOWED_VIDEO_EXTENSIONS:
-                        success = self.video_compressor.compress(upload_path, output_path)
-                    
-                    if success and os.path.exists(output_path):
-                        original_size = os.path.getsize(upload_path)
-                        compressed_size = os.path.getsize(output_path)
-                        compression_ratio = (1 - compressed_size / original_size) * 100 if original_size > 0 else 0
-                        
-                        file_info = {
-                            'original_filename': filename,
-                            'output_filename': output_filename,
-                            'output_path': output_path,
-                            'upload_path': upload_path,  # 保存用于后续删除和预览
-                            'file_ext': file_ext,
-                            'original_size': original_size,
-                            'compressed_size': compressed_size,
-                            'compression_ratio': compression_ratio,
-                            'status': 'completed'
-                        }
-                        task['files'].append(file_info)
-                        task['completed'] += 1
-                        self.logger.info(f"Web批量压缩完成 [{idx+1}/{total}]: {filename}")
-                    else:
-                        task['files'].append({
-                            'original_filename': filename,
-                            'upload_path': upload_path,  # 保存用于后续删除
-                            'file_ext': file_ext,
-                            'status': 'failed',
-                            'error': '压缩失败'
-                        })
-                        task['failed'] += 1
-                        self.logger.error(f"Web批量压缩失败 [{idx+1}/{total}]: {filename}")
-                    
+                    file_info = future.result()
                 except Exception as e:
-                    task['files'].append({
+                    file_info = {
                         'original_filename': filename,
-                        'upload_path': upload_path,  # 保存用于后续删除
+                        'upload_path': upload_path,
                         'file_ext': file_ext,
                         'status': 'failed',
                         'error': str(e)
-                    })
-                    task['failed'] += 1
-                    self.logger.error(f"Web批量压缩错误 [{idx+1}/{total}]: {str(e)}")
+                    }
+                done += 1
                 
-                # 更新进度
-                task['progress'] = int((idx + 1) / total * 100)
+                if file_info['status'] == 'completed':
+                    completed += 1
+                else:
+                    failed += 1
+                self._update_file(task_id, idx, **file_info)
+                if file_info['status'] == 'completed':
+                    self._index_file(task_id, idx, filename, file_info['output_filename'])
+                self._update_task(task_id, completed=completed, failed=failed,
+                                  progress=int(done / total * 100))
+                
+                if file_info['status'] == 'completed':
+                    self.logger.info(f"Web批量压缩完成 [{done}/{total}]: {filename}")
+                else:
+                    self.logger.error(f"Web批量压缩失败 [{done}/{total}]: {filename}, 错误: {file_info.get('error')}")
             
             # 更新任务状态
-            if task['failed'] == 0:
-                task['status'] = 'completed'
-            elif task['completed'] > 0:
-                task['status'] = 'partial'
+            if failed == 0:
+                status = 'completed'
+            elif completed > 0:
+                status = 'partial'
             else:
-                task['status'] = 'failed'
+                status = 'failed'
+            self._update_task(task_id, status=status)
             
-            self.logger.info(f"Web批量压缩任务完成: {task_id}, 成功: {task['completed']}, 失败: {task['failed']}")
+            self.logger.info(f"Web批量压缩任务完成: {task_id}, 成功: {completed}, 失败: {failed}")
             
         except Exception as e:
-            task['status'] = 'failed'
-            task['error'] = str(e)
+            self._update_task(task_id, status='failed', error=str(e))
             self.logger.error(f"Web批量压缩任务错误: {str(e)}")
     
     def start(self):
@@ -1045,8 +1732,22 @@ class WebServer:
             return
         
         try:
-            self.server = make_server(self.host, self.port, self.app, threaded=True)
-            self.server_thread = threading.Thread(target=self.server.serve_forever)
+            # 停止服务器时线程池已关闭，重新启动时需要重建
+            if self.executor is None:
+                self.executor = self._create_executor()
+            if self.production is not False and create_server is not None:
+                # 长轮询和SSE请求会占用工作线程，线程数比压缩并行数多留余量
+                # waitress默认只接受1GB的请求体，与Flask的MAX_CONTENT_LENGTH保持一致
+                self.server = create_server(self.app, host=self.host, port=self.port,
+                                            threads=self.threads,
+                                            max_request_body_size=self.app.config['MAX_CONTENT_LENGTH'])
+                serve = self.server.run
+            else:
+                if self.production:
+                    self.logger.warning("未安装waitress，使用开发服务器")
+                self.server = make_server(self.host, self.port, self.app, threaded=True)
+                serve = self.server.serve_forever
+            self.server_thread = threading.Thread(target=serve)
             self.server_thread.daemon = True
             self.server_thread.start()
             self.is_running = True
@@ -1062,12 +1763,30 @@ class WebServer:
         
         try:
             if self.server:
-                self.server.shutdown()
+                # waitress服务器使用close()停止，开发服务器使用shutdown()
+                if hasattr(self.server, 'shutdown'):
+                    self.server.shutdown()
+                else:
+                    # close()不会结束waitress的工作线程，需要先关闭任务调度器，否则每次重启都会遗留线程
+                    self.server.task_dispatcher.shutdown()
+                    self.server.close()
+                    # 服务线程最多在下一次轮询超时（1秒）后退出，退出后端口才真正释放，立即重启不会端口冲突
+                    if self.server_thread is not None:
+                        self.server_thread.join(timeout=2)
+            # 不等待正在运行的压缩任务，ffmpeg子进程结束后线程自行退出
+            if self.executor:
+                self.executor.shutdown(wait=False)
+                self.executor = None
             self.is_running = False
             self.logger.info("Web服务器已停止")
         except Exception as e:
             self.logger.error(f"停止Web服务器失败: {str(e)}")
     
+    def _create_executor(self):
+        """创建压缩线程池（并行数默认为CPU核心数的一半，至少2个）"""
+        max_workers = self.config_manager.get('max_parallel_jobs', 0) or max(2, (os.cpu_count() or 1) // 2)
+        return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='compress')
+    
     def get_url(self):
         """获取服务器URL"""
         if self.is_running:
@@ -1086,164 +1805,207 @@ class WebServer:
             'nvidia', 'amd', 或 None（表示使用CPU）
         """
         ffmpeg_path = self.config_manager.get('ffmpeg_path', 'ffmpeg')
+        if ffmpeg_path not in self._detected_gpu_cache:
+            self._detected_gpu_cache[ffmpeg_path] = self._load_or_probe_gpu(ffmpeg_path)
+        return self._detected_gpu_cache[ffmpeg_path]
+    
+    def _load_or_probe_gpu(self, ffmpeg_path):
+        """
+        读取配置文件中保存的GPU检测结果，过期或驱动/FFmpeg变化时重新检测并保存
         
-        # 首先检查Nvidia GPU
-        if self._check_nvidia_gpu(ffmpeg_path):
-            return 'nvidia'
+        检测结果保存在web_config.ini的GPU_DETECT_SECTION段中（检测结果、检测时间和当时的驱动指纹），
+        由__init__中随use_gpu一起写入配置文件。
+        """
+        config = self.config_manager.config
+        fingerprint = self._gpu_driver_fingerprint(ffmpeg_path)
+        cached = config.get(GPU_DETECT_SECTION, 'cached', fallback='')
+        try:
+            detect_ts = config.getint(GPU_DETECT_SECTION, 'timestamp', fallback=0)
+        except ValueError:
+            detect_ts = 0
+        if (cached and time.time() - detect_ts < GPU_DETECT_TTL
+                and config.get(GPU_DETECT_SECTION, 'fingerprint', fallback='') == fingerprint):
+            self.logger.debug(f"使用已保存的GPU检测结果: {cached}")
+            return None if cached == 'cpu' else cached
         
-        # 然后检查AMD GPU
-        if self._check_amd_gpu(ffmpeg_path):
-            return 'amd'
+        detected = self._probe_available_gpu(ffmpeg_path)
+        if not config.has_section(GPU_DETECT_SECTION):
+            config.add_section(GPU_DETECT_SECTION)
+        config.set(GPU_DETECT_SECTION, 'cached', detected or 'cpu')
+        config.set(GPU_DETECT_SECTION, 'timestamp', str(int(time.time())))
+        config.set(GPU_DETECT_SECTION, 'fingerprint', fingerprint)
+        return detected
+    
+    @staticmethod
+    def _gpu_driver_fingerprint(ffmpeg_path):
+        """
+        生成FFmpeg和显卡驱动的指纹（文件修改时间或驱动版本），任一变化时需要重新检测GPU
+        """
+        parts = []
+        ffmpeg_file = ffmpeg_path if os.path.isfile(ffmpeg_path) else shutil.which(ffmpeg_path)
+        candidates = [ffmpeg_file]
+        if sys.platform == 'win32':
+            system32 = os.path.join(os.environ.get('SystemRoot', r'C:\Windows'), 'System32')
+            candidates.append(os.path.join(system32, 'nvidia-smi.exe'))
+            candidates.append(os.path.join(system32, 'amfrt64.dll'))
+        for path in candidates:
+            if not path:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            parts.append(f"{path}:{st.st_mtime_ns}:{st.st_size}")
+        
+        # /proc中文件的修改时间没有意义，直接使用驱动版本内容
+        nvidia_version = '/proc/driver/nvidia/version'
+        if os.path.isfile(nvidia_version):
+            try:
+                with open(nvidia_version, 'r', encoding='utf-8', errors='ignore') as f:
+                    parts.append(f.readline().strip())
+            except OSError:
+                pass
+        return '|'.join(parts)
+    
+    def _probe_available_gpu(self, ffmpeg_path):
+        """依次运行FFmpeg测试Nvidia和AMD编码器"""
+        # FFmpeg编码器列表只获取一次，两个检查共用
+        encoders = self._list_encoders(ffmpeg_path)
+        if encoders is None:
+            return None
+        
+        # 按顺序检查：先Nvidia，再AMD
+        for gpu_type, encoder_names, codec_args, error_keywords in GPU_PROBES:
+            if not any(name in encoders for name in encoder_names):
+                continue
+            if gpu_type == 'nvidia':
+                # NVML能给出明确结果时不再试编码（试编码需要初始化CUDA和编码器，耗时1-3秒）
+                nvml_result = self._nvml_encoder_available()
+                if nvml_result is not None:
+                    if nvml_result:
+                        self.logger.info("检测到Nvidia GPU支持（NVENC编码器，NVML）")
+                        return gpu_type
+                    self.logger.debug("NVML未找到支持NVENC的Nvidia GPU")
+                    continue
+            if self._check_gpu(ffmpeg_path, gpu_type, codec_args, error_keywords):
+                return gpu_type
         
         # 没有可用的GPU，返回None（使用CPU）
         return None
     
-    def _check_nvidia_gpu(self, ffmpeg_path):
-        """检查Nvidia GPU是否可用"""
+    def _list_encoders(self, ffmpeg_path):
+        """
+        获取FFmpeg支持的编码器列表
+        
+        Returns:
+            ffmpeg -encoders的原始输出（bytes），FFmpeg无法运行时返回None
+        """
         try:
-            # 首先检查FFmpeg是否支持NVENC编码器
-            cmd = [
-                ffmpeg_path,
-                '-hide_banner',
-                '-encoders'
-            ]
             result = subprocess.run(
-                cmd,
+                [ffmpeg_path, '-hide_banner', '-encoders'],
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 timeout=5,
                 shell=False,
                 creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
             )
-            
-            if result.returncode == 0:
-                output = result.stdout.decode('utf-8', errors='ignore')
-                # 检查是否包含NVENC编码器
-                if 'h264_nvenc' in output or 'hevc_nvenc' in output:
-                    # 进一步检查：尝试实际初始化编码器以验证硬件是否存在
-                    # 使用一个简单的测试命令来检测硬件
-                    test_cmd = [
-                        ffmpeg_path,
-                        '-hide_banner',
-                        '-f', 'lavfi',
-                        '-i', 'testsrc=duration=0.1:size=320x240:rate=1',
-                        '-c:v', 'h264_nvenc',
-                        '-preset', 'fast',
-                        '-frames:v', '1',
-                        '-f', 'null',
-                        '-'
-                    ]
-                    test_result = subprocess.run(
-                        test_cmd,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        timeout=10,
-                        shell=False,
-                        creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
-                    )
-                    
-                    # 只有测试命令成功（returncode == 0）才认为检测到GPU硬件
-                    # 如果失败，检查错误信息中是否明确表示硬件不存在
-                    error_output = test_result.stderr.decode('utf-8', errors='ignore').lower()
-                    if test_result.returncode == 0:
-                        # 测试命令成功，说明硬件存在且可用
-                        self.logger.info("检测到Nvidia GPU支持（NVENC编码器）")
-                        return True
-                    else:
-                        # 测试命令失败，检查是否是硬件不存在导致的
-                        hardware_error_keywords = [
-                            'no device', 'no hardware', 'no nvenc device', 
-                            'could not find', 'failed to initialize',
-                            'no nvenc capable devices found',
-                            'no nvenc capable device found',
-                            'no nvenc devices found'
-                        ]
-                        if any(keyword in error_output for keyword in hardware_error_keywords):
-                            self.logger.debug("FFmpeg支持NVENC，但未检测到Nvidia GPU硬件")
-                            return False
-                        else:
-                            # 其他错误，可能是配置问题，但不一定是硬件不存在
-                            # 为了安全起见，不认为检测到GPU
-                            self.logger.debug(f"NVENC测试命令失败，不确定硬件是否存在。错误: {error_output[:200]}")
-                            return False
-            
-            return False
         except Exception as e:
-            self.logger.debug(f"检查Nvidia GPU时出错: {str(e)}")
-            return False
+            self.logger.debug(f"获取FFmpeg编码器列表时出错: {str(e)}")
+            return None
+        if result.returncode != 0:
+            return None
+        # 不解码，直接在bytes上查找编码器名
+        return result.stdout
     
-    def _check_amd_gpu(self, ffmpeg_path):
-        """检查AMD GPU是否可用"""
+    def _check_gpu(self, ffmpeg_path, gpu_type, codec_args, error_keywords):
+        """
+        用FFmpeg试编码一帧，检查GPU硬件编码器是否可用
+        
+        Args:
+            ffmpeg_path: FFmpeg路径
+            gpu_type: GPU类型（nvidia/amd），用于日志
+            codec_args: 试编码使用的编码器参数
+            error_keywords: 表示硬件不存在的错误信息关键字
+            
+        Returns:
+            测试命令成功时返回True
+        """
+        gpu_name = self._get_gpu_name(gpu_type)
         try:
-            # 首先检查FFmpeg是否支持AMF编码器
-            cmd = [
+            # 尝试实际初始化编码器以验证硬件是否存在
+            # 使用一个简单的测试命令来检测硬件
+            test_cmd = [
                 ffmpeg_path,
                 '-hide_banner',
-                '-encoders'
+                '-f', 'lavfi',
+                '-i', 'testsrc=duration=0.1:size=320x240:rate=1',
+                *codec_args,
+                '-frames:v', '1',
+                '-f', 'null',
+                '-'
             ]
-            result = subprocess.run(
-                cmd,
+            test_result = subprocess.run(
+                test_cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                timeout=5,
+                timeout=10,
                 shell=False,
                 creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
             )
             
-            if result.returncode == 0:
-                output = result.stdout.decode('utf-8', errors='ignore')
-                # 检查是否包含AMF编码器
-                if 'h264_amf' in output or 'hevc_amf' in output:
-                    # 进一步检查：尝试实际初始化编码器以验证硬件是否存在
-                    # 使用一个简单的测试命令来检测硬件
-                    test_cmd = [
-                        ffmpeg_path,
-                        '-hide_banner',
-                        '-f', 'lavfi',
-                        '-i', 'testsrc=duration=0.1:size=320x240:rate=1',
-                        '-c:v', 'h264_amf',
-                        '-frames:v', '1',
-                        '-f', 'null',
-                        '-'
-                    ]
-                    test_result = subprocess.run(
-                        test_cmd,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        timeout=10,
-                        shell=False,
-                        creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
-                    )
-                    
-                    # 只有测试命令成功（returncode == 0）才认为检测到GPU硬件
-                    # 如果失败，检查错误信息中是否明确表示硬件不存在
-                    error_output = test_result.stderr.decode('utf-8', errors='ignore').lower()
-                    if test_result.returncode == 0:
-                        # 测试命令成功，说明硬件存在且可用
-                        self.logger.info("检测到AMD GPU支持（AMF编码器）")
-                        return True
-                    else:
-                        # 测试命令失败，检查是否是硬件不存在导致的
-                        hardware_error_keywords = [
-                            'no device', 'no hardware', 'no amf device', 
-                            'could not find', 'failed to initialize',
-                            'no amf capable devices found',
-                            'no amf capable device found'
-                        ]
-                        if any(keyword in error_output for keyword in hardware_error_keywords):
-                            self.logger.debug("FFmpeg支持AMF，但未检测到AMD GPU硬件")
-                            return False
-                        else:
-                            # 其他错误，可能是配置问题，但不一定是硬件不存在
-                            # 为了安全起见，不认为检测到GPU
-                            self.logger.debug(f"AMF测试命令失败，不确定硬件是否存在。错误: {error_output[:200]}")
-                            return False
+            # 只有测试命令成功（returncode == 0）才认为检测到GPU硬件
+            if test_result.returncode == 0:
+                self.logger.info(f"检测到{gpu_name}支持")
+                return True
             
+            # 测试命令失败，检查是否是硬件不存在导致的
+            error_output = test_result.stderr.decode('utf-8', errors='ignore').lower()
+            if any(keyword in error_output for keyword in error_keywords):
+                self.logger.debug(f"FFmpeg支持{gpu_name}编码器，但未检测到硬件")
+            else:
+                # 其他错误，可能是配置问题，但不一定是硬件不存在
+                # 为了安全起见，不认为检测到GPU
+                self.logger.debug(f"{gpu_name}测试命令失败，不确定硬件是否存在。错误: {error_output[:200]}")
             return False
         except Exception as e:
-            self.logger.debug(f"检查AMD GPU时出错: {str(e)}")
+            self.logger.debug(f"检查{gpu_name}时出错: {str(e)}")
             return False
     
+    @staticmethod
+    def _nvml_encoder_available():
+        """
+        通过NVML查询是否有支持硬件编码的Nvidia GPU
+        
+        Returns:
+            True/False，未安装pynvml或NVML无法给出结果时返回None（需要用FFmpeg试编码确认）
+        """
+        if pynvml is None:
+            return None
+        try:
+            pynvml.nvmlInit()
+        except pynvml.NVMLError:
+            return None
+        try:
+            count = pynvml.nvmlDeviceGetCount()
+            if count == 0:
+                return False
+            for index in range(count):
+                handle = pynvml.nvmlDeviceGetHandleByIndex(index)
+                # 没有NVENC的显卡会抛出NotSupported；有NVENC时返回剩余编码能力（百分比）
+                try:
+                    pynvml.nvmlDeviceGetEncoderCapacity(handle, pynvml.NVML_ENCODER_QUERY_H264)
+                    return True
+                except pynvml.NVMLError_NotSupported:
+                    continue
+            return False
+        except pynvml.NVMLError:
+            return None
+        finally:
+            try:
+                pynvml.nvmlShutdown()
+            except pynvml.NVMLError:
+                pass
+    
     def _get_gpu_name(self, gpu_type):
         """获取GPU类型名称"""
         names = {
@@ -1254,68 +2016,60 @@ class WebServer:
         return names.get(gpu_type, '未知')
     
     def _generate_download_token(self, task_id, filename):
-        """生成下载令牌（带时间戳）"""
-        import hashlib
-        import hmac
-        import time
-        
-        # 使用任务ID、文件名和当前时间（分钟级别）生成令牌
-        timestamp = int(time.time() / 300)  # 5分钟有效期
-        secret = f"{task_id}_{filename}_{timestamp}"
-        token = hashlib.sha256(secret.encode()).hexdigest()
+        """
+        生成下载令牌（带时间戳的BLAKE2b密钥签名）
+        
+        同一时间窗口内复用已生成的令牌，缓存保存在任务的_tokens字段中（随任务一起删除）；
+        任务不存在时（例如请求中伪造的任务ID）只计算不缓存，外部请求无法让缓存无限增长。
+        """
+        # 使用任务ID、文件名和当前时间窗口生成令牌（整数运算，不经过浮点除法）
+        timestamp = time.time_ns() // TOKEN_WINDOW_NS
+        with self._tasks_lock:
+            task = self.tasks.get(task_id)
+            task_tokens = task.setdefault('_tokens', {}) if task is not None else None
+            cached = task_tokens.get(filename) if task_tokens is not None else None
+        if cached and cached[0] == timestamp:
+            return cached[1]
+        
+        message = b'%s_%s_%d' % (task_id.encode(), filename.encode(), timestamp)
+        token = hashlib.blake2b(message, key=self._token_key, digest_size=16).hexdigest()
+        if task_tokens is not None:
+            with self._tasks_lock:
+                task_tokens[filename] = (timestamp, token)
         return token
     
+    def _discard_upload(self, upload_path):
+        """删除压缩完成后的上传文件（文件已不存在时忽略）"""
+        try:
+            os.unlink(upload_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.logger.warning(f"删除上传文件失败: {upload_path}, 错误: {str(e)}")
+    
     def _delete_file_after_download(self, file_path):
-        """下载后删除文件"""
+        """删除文件（在_FileReaper线程中运行，文件已不存在时忽略）"""
         try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                self.logger.info(f"已删除文件: {file_path}")
+            os.unlink(file_path)
+            self.logger.info(f"已删除文件: {file_path}")
+        except FileNotFoundError:
+            pass
         except Exception as e:
             self.logger.error(f"删除文件失败: {file_path}, 错误: {e}")
     
     def _delete_task_files(self, task_id):
-        """删除任务相关的所有文件"""
+        """删除任务相关的所有文件（交给后台删除线程，请求不等待删除完成）"""
         try:
-            if task_id not in self.tasks:
+            task = self._get_task(task_id)
+            if task is None:
                 return
             
-            task = self.tasks[task_id]
-            
-            # 删除单文件任务的文件
-            if 'output_path' in task:
-                output_path = task.get('output_path')
-                upload_path = task.get('upload_path')
-                if output_path and os.path.exists(output_path):
-                    try:
-                        os.remove(output_path)
-                        self.logger.info(f"已删除输出文件: {output_path}")
-                    except Exception:
-                        pass
-                if upload_path and os.path.exists(upload_path):
-                    try:
-                        os.remove(upload_path)
-                        self.logger.info(f"已删除上传文件: {upload_path}")
-                    except Exception:
-                        pass
-            
-            # 删除批量任务的文件
-            if 'files' in task:
-                for file_info in task.get('files', []):
-                    output_path = file_info.get('output_path')
-                    upload_path = file_info.get('upload_path')
-                    if output_path and os.path.exists(output_path):
-                        try:
-                            os.remove(output_path)
-                            self.logger.info(f"已删除输出文件: {output_path}")
-                        except Exception:
-                            pass
-                    if upload_path and os.path.exists(upload_path):
-                        try:
-                            os.remove(upload_path)
-                            self.logger.info(f"已删除上传文件: {upload_path}")
-                        except Exception:
-                            pass
+            # 单文件任务的路径在任务本身，批量任务的路径在各文件信息中
+            for file_info in task.get('files', [task]):
+                for key in ('output_path', 'upload_path'):
+                    path = file_info.get(key)
+                    if path:
+                        self._reaper.schedule(path, 0)
         except Exception as e:
             self.logger.error(f"删除任务文件失败: {task_id}, 错误: {e}")
 